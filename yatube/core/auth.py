@@ -0,0 +1,65 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+USER_CACHE_TIMEOUT = 60 * 60 * 24
+# Хэш пароля в кэш не кладём.
+SECRET_FIELDS = ('password',)
+
+
+def user_cache_key(user_id):
+    return f'auth-user:{user_id}'
+
+
+def forget_user(user_id):
+    cache.delete(user_cache_key(user_id))
+
+
+def cached_fields(user):
+    """Поля пользователя для кэша и хэш сессии вместо хэша пароля."""
+    fields = {
+        field.attname: getattr(user, field.attname)
+        for field in user._meta.concrete_fields
+        if field.attname not in SECRET_FIELDS
+    }
+    return fields, user.get_session_auth_hash()
+
+
+def rebuild_user(fields, session_hash):
+    """Пользователь из кэша: пароль отложен и при save() не пишется.
+
+    AuthenticationMiddleware сверяет сессию по get_session_auth_hash;
+    его значение то же, что уже лежит в самой сессии. Когда пароль
+    загружен или сменён (set_password), хэш считается как обычно.
+    """
+    user = get_user_model().from_db(
+        DEFAULT_DB_ALIAS, list(fields), list(fields.values()))
+
+    def get_session_auth_hash():
+        if 'password' in user.__dict__:
+            return type(user).get_session_auth_hash(user)
+        return session_hash
+
+    user.get_session_auth_hash = get_session_auth_hash
+    return user
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend, который достаёт пользователя сессии из кэша.
+
+    В кэше только поля без пароля и хэш сессии. Запись сбрасывают сигналы
+    из core.signals, поэтому после смены пароля первый же запрос
+    перечитает пользователя из базы и сверит сессию с новым паролем.
+    """
+
+    def get_user(self, user_id):
+        key = user_cache_key(user_id)
+        cached = cache.get(key)
+        if cached is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                cache.set(key, cached_fields(user), USER_CACHE_TIMEOUT)
+            return user
+        user = rebuild_user(*cached)
+        return user if self.user_can_authenticate(user) else None
@@ -0,0 +1,285 @@
+import os
+import pickle
+import tempfile
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.files import locks
+from django.core.files.move import file_move_safe
+from django.utils.module_loading import import_string
+
+SHARED_BACKEND = 'core.cache.LockingFileBasedCache'
+
+# Как в LocMemCache: Django создаёт бэкенд на каждый поток, а память
+# яруса и статистика должны быть общими на процесс.
+_locals = {}
+_locks = {}
+_stats = {}
+# Когда каталогу файлового кэша в этом процессе снова пора на чистку.
+_next_cull = {}
+_cull_lock = threading.Lock()
+
+
+class LockingFileBasedCache(FileBasedCache):
+    """Файловый кэш, в котором add и incr атомарны между процессами.
+
+    В FileBasedCache add — это has_key и set, а incr — get и set со
+    сроком по умолчанию, поэтому два воркера оба «захватывают» блокировку
+    singleflight, теряют прибавки к счётчикам, а вечный или суточный
+    счётчик после первого incr живёт 300 секунд. Здесь обе операции идут
+    под общей flock-блокировкой каталога, и incr сохраняет срок ключа.
+
+    Гарантии только в пределах одной машины и только между add и incr:
+    set и delete по-прежнему пишут без блокировки. Для нескольких машин
+    нужен общий бэкенд с атомарными операциями (memcached, Redis) в
+    SHARED_BACKEND у TieredCache.
+
+    FileBasedCache на каждой записи обходит весь каталог ради MAX_ENTRIES:
+    при тысячах файлов это десятки миллисекунд на set. Здесь чистка идёт не
+    чаще раза в OPTIONS['CULL_INTERVAL'] секунд на процесс (по умолчанию
+    60), так что запись стоит O(1), а MAX_ENTRIES соблюдается с запасом в
+    записи за этот интервал.
+    """
+    lock_name = 'cache.lock'
+
+    def __init__(self, dir, params):
+        super().__init__(dir, params)
+        options = params.get('OPTIONS', {})
+        self.cull_interval = options.get('CULL_INTERVAL', 60)
+
+    def _cull(self):
+        now = time.monotonic()
+        with _cull_lock:
+            if now < _next_cull.get(self._dir, 0):
+                return
+            _next_cull[self._dir] = now + self.cull_interval
+        super()._cull()
+
+    @contextmanager
+    def _locked(self):
+        self._createdir()
+        with open(os.path.join(self._dir, self.lock_name), 'ab') as file:
+            locks.lock(file, locks.LOCK_EX)
+            try:
+                yield
+            finally:
+                locks.unlock(file)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        with self._locked():
+            return super().add(key, value, timeout, version)
+
+    def incr(self, key, delta=1, version=None):
+        fname = self._key_to_file(key, version)
+        with self._locked():
+            try:
+                with open(fname, 'rb') as file:
+                    expiry = pickle.load(file)
+                    value = pickle.loads(zlib.decompress(file.read()))
+            except FileNotFoundError:
+                expiry, value = 0, None
+            if expiry is not None and expiry < time.time():
+                self._delete(fname)
+                raise ValueError(f"Key '{key}' not found")
+            value += delta
+            self._replace(fname, expiry, value)
+        return value
+
+    def _replace(self, fname, expiry, value):
+        """Как set, но с уже посчитанным абсолютным сроком."""
+        fd, tmp_path = tempfile.mkstemp(dir=self._dir)
+        renamed = False
+        try:
+            with open(fd, 'wb') as file:
+                file.write(pickle.dumps(expiry, self.pickle_protocol))
+                file.write(zlib.compress(
+                    pickle.dumps(value, self.pickle_protocol)))
+            file_move_safe(tmp_path, fname, allow_overwrite=True)
+            renamed = True
+        finally:
+            if not renamed:
+                os.remove(tmp_path)
+
+
+class TieredCache(BaseCache):
+    """Кэш в два яруса: LRU в памяти процесса поверх общего бэкенда.
+
+    Общий ярус (по умолчанию LockingFileBasedCache, LOCATION — каталог)
+    видят все воркеры на машине; его add и incr атомарны только в пределах
+    машины, остальное — по возможности, как в любом файловом кэше.
+    В память процесса попадают только ключи с префиксами из
+    LOCAL_KEY_PREFIXES: это ключи, в которые уже вшита версия
+    (core.versions), поэтому при смене данных другой воркер просто
+    спросит новый ключ, а старая копия тихо вытеснится. Счётчики и сами
+    версии всегда читаются из общего яруса.
+
+    OPTIONS: SHARED_BACKEND, SHARED_OPTIONS, LOCAL_MAX_ENTRIES,
+    LOCAL_TIMEOUT, LOCAL_KEY_PREFIXES.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        backend = import_string(options.get('SHARED_BACKEND', SHARED_BACKEND))
+        self.shared = backend(location, {
+            'TIMEOUT': params.get('TIMEOUT', 300),
+            'KEY_PREFIX': params.get('KEY_PREFIX', ''),
+            'VERSION': params.get('VERSION', 1),
+            'KEY_FUNCTION': params.get('KEY_FUNCTION'),
+            'OPTIONS': options.get('SHARED_OPTIONS', {}),
+        })
+        self.local_max_entries = options.get('LOCAL_MAX_ENTRIES', 1000)
+        self.local_timeout = options.get('LOCAL_TIMEOUT', 60)
+        self.local_prefixes = tuple(options.get('LOCAL_KEY_PREFIXES', ()))
+        self._local = _locals.setdefault(location, OrderedDict())
+        self._lock = _locks.setdefault(location, threading.Lock())
+        self._stats = _stats.setdefault(location, {
+            'local': {'hits': 0, 'misses': 0},
+            'shared': {'hits': 0, 'misses': 0},
+        })
+
+    def stats(self):
+        """Попадания и промахи по ярусам с момента запуска процесса."""
+        with self._lock:
+            return {
+                tier: dict(counts, entries=len(self._local))
+                if tier == 'local' else dict(counts)
+                for tier, counts in self._stats.items()
+            }
+
+    def _count(self, tier, hits=0, misses=0):
+        with self._lock:
+            self._stats[tier]['hits'] += hits
+            self._stats[tier]['misses'] += misses
+
+    def _is_local(self, key):
+        return key.startswith(self.local_prefixes)
+
+    def _local_get(self, key, version):
+        local_key = self.make_key(key, version)
+        with self._lock:
+            entry = self._local.get(local_key)
+            if entry is None:
+                return None
+            expires, pickled = entry
+            if expires < time.monotonic():
+                del self._local[local_key]
+                return None
+            self._local.move_to_end(local_key)
+        return pickle.loads(pickled)
+
+    def _local_set(self, key, value, timeout, version):
+        timeout = self.get_backend_timeout(timeout)
+        if timeout is not None:
+            if timeout <= 0:
+                return
+            timeout = min(timeout - time.time(), self.local_timeout)
+        else:
+            timeout = self.local_timeout
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        local_key = self.make_key(key, version)
+        with self._lock:
+            self._local[local_key] = (time.monotonic() + timeout, pickled)
+            self._local.move_to_end(local_key)
+            while len(self._local) > self.local_max_entries:
+                self._local.popitem(last=False)
+
+    def _local_delete(self, key, version):
+        with self._lock:
+            self._local.pop(self.make_key(key, version), None)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.shared.add(key, value, timeout, version)
+        if added and self._is_local(key):
+            self._local_set(key, value, timeout, version)
+        return added
+
+    def get(self, key, default=None, version=None):
+        if self._is_local(key):
+            value = self._local_get(key, version)
+            if value is not None:
+                self._count('local', hits=1)
+                return value
+            self._count('local', misses=1)
+        value = self.shared.get(key, version=version)
+        if value is None:
+            self._count('shared', misses=1)
+            return default
+        self._count('shared', hits=1)
+        if self._is_local(key):
+            self._local_set(key, value, self.local_timeout, version)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout, version)
+        if self._is_local(key):
+            self._local_set(key, value, timeout, version)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, timeout, version)
+
+    def delete(self, key, version=None):
+        self._local_delete(key, version)
+        self.shared.delete(key, version)
+
+    def get_many(self, keys, version=None):
+        found = {}
+        rest = []
+        for key in keys:
+            value = (self._local_get(key, version)
+                     if self._is_local(key) else None)
+            if value is not None:
+                found[key] = value
+            else:
+                if self._is_local(key):
+                    self._count('local', misses=1)
+                rest.append(key)
+        self._count('local', hits=len(found))
+        if rest:
+            shared = self.shared.get_many(rest, version=version)
+            self._count('shared', hits=len(shared),
+                        misses=len(rest) - len(shared))
+            for key, value in shared.items():
+                if self._is_local(key):
+                    self._local_set(key, value, self.local_timeout, version)
+            found.update(shared)
+        return found
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.shared.set_many(data, timeout, version)
+        for key, value in data.items():
+            if self._is_local(key) and key not in failed:
+                self._local_set(key, value, timeout, version)
+        return failed
+
+    def delete_many(self, keys, version=None):
+        for key in keys:
+            self._local_delete(key, version)
+        self.shared.delete_many(keys, version)
+
+    def has_key(self, key, version=None):
+        if self._is_local(key) and \
+                self._local_get(key, version) is not None:
+            return True
+        return self.shared.has_key(key, version)
+
+    def incr(self, key, delta=1, version=None):
+        self._local_delete(key, version)
+        return self.shared.incr(key, delta, version)
+
+    def decr(self, key, delta=1, version=None):
+        self._local_delete(key, version)
+        return self.shared.decr(key, delta, version)
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+        self.shared.clear()
+
+    def close(self, **kwargs):
+        self.shared.close(**kwargs)
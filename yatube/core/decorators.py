@@ -0,0 +1,131 @@
+import hashlib
+import re
+from functools import wraps
+
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition
+
+from .singleflight import cached_call
+from .versions import get_versions, modified_at, versioned_key
+
+FRAGMENT_RE = re.compile(r'<!--user-fragment:([\w/.-]+)-->')
+
+
+def cookieless(view):
+    """Разрешает анониму без сессии быстрый путь core.middleware."""
+    view.cookieless = True
+    return view
+
+
+def stitch_user_fragments(content, request):
+    return FRAGMENT_RE.sub(
+        lambda match: render_to_string(match.group(1), request=request),
+        content,
+    )
+
+
+def shared_page_key(request):
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return f'shared-page:{path}'
+
+
+def request_versions(request, namespaces, args, kwargs):
+    """Пространства страницы и их версии, один раз на запрос."""
+    if not hasattr(request, '_page_versions'):
+        spaces = namespaces(request, *args, **kwargs)
+        request._page_versions = spaces, get_versions(spaces)
+    return request._page_versions
+
+
+def conditional_page(namespaces):
+    """ETag и Last-Modified из версий пространств, без рендера страницы.
+
+    Совпавший If-None-Match / If-Modified-Since сразу получает 304.
+    В ETag входит пользователь: шапка и кнопки у каждого свои. Входит и
+    секрет CSRF: после входа он новый, и сохранённая страница с формой
+    отправила бы устаревший {% csrf_token %}.
+    """
+    def etag(request, *args, **kwargs):
+        spaces, versions = request_versions(request, namespaces, args, kwargs)
+        user = request.user.pk if request.user.is_authenticated else ''
+        # CsrfViewMiddleware кладёт сюда секрет из куки или сессии.
+        csrf = request.META.get('CSRF_COOKIE', '')
+        raw = '|'.join([request.get_full_path(), f'{user}', csrf, *(
+            f'{space}={versions[space]}' for space in spaces)])
+        return hashlib.md5(raw.encode()).hexdigest()
+
+    def last_modified(request, *args, **kwargs):
+        _, versions = request_versions(request, namespaces, args, kwargs)
+        return modified_at(versions)
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
+
+
+def patch_shared_headers(response, request, timeout, versioned):
+    patch_vary_headers(response, ('Cookie',))
+    if request.user.is_authenticated:
+        patch_cache_control(response, private=True)
+    elif versioned:
+        patch_cache_control(response, no_cache=True)
+    else:
+        patch_cache_control(response, max_age=timeout)
+
+
+def cache_shared_page(timeout, namespaces=None, stale=None):
+    """Кэширует страницу одной для всех, как cache_page для анонима.
+
+    Фрагменты, подключённые через {% user_fragment %}, в кэш не попадают:
+    их дорисовываем под текущего пользователя на каждом запросе, поэтому
+    вошедшие пользователи попадают в тот же кэш, что и анонимы.
+
+    namespaces(request, *args, **kwargs) возвращает пространства версий,
+    от которых зависит страница. Версия входит в ключ, так что смена
+    данных сразу даёт новый ключ и timeout можно держать долгим; браузеру
+    в этом случае велим перепроверять страницу при каждом заходе.
+
+    Пересчёт идёт через core.singleflight: истёкшую страницу рендерит
+    один запрос, остальные stale секунд получают прежнюю копию.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            key = shared_page_key(request)
+            if namespaces is not None:
+                key = versioned_key(key, *request_versions(
+                    request, namespaces, args, kwargs))
+            rendered = {}
+
+            def render():
+                request.defer_user_fragments = True
+                try:
+                    response = view(request, *args, **kwargs)
+                finally:
+                    request.defer_user_fragments = False
+                rendered['response'] = response
+                if response.streaming or response.status_code != 200:
+                    return None
+                return (response.content.decode(response.charset),
+                        response['Content-Type'])
+
+            cached = cached_call(key, render, timeout, stale)
+            response = rendered.get('response')
+            if response is not None:
+                if response.streaming:
+                    return response
+                content = response.content.decode(response.charset)
+                response.content = stitch_user_fragments(content, request)
+            else:
+                content, content_type = cached
+                response = HttpResponse(
+                    stitch_user_fragments(content, request),
+                    content_type=content_type,
+                )
+            patch_shared_headers(
+                response, request, timeout, namespaces is not None)
+            return response
+        return wrapper
+    return decorator
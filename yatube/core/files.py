@@ -0,0 +1,226 @@
+import mimetypes
+import os
+import posixpath
+import re
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import (FileResponse, Http404, HttpResponse,
+                         HttpResponseNotModified, StreamingHttpResponse)
+from django.urls import re_path
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+
+from .decorators import cookieless
+
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+CHUNK_SIZE = 64 * 1024
+# Имя с хэшем содержимого: posts/ab/<sha256>.jpg, миниатюры sorl и
+# статика после collectstatic (style.0123456789ab.css).
+HASHED_NAME = re.compile(r'(?:^|[./])[0-9a-f]{12,64}\.[^./]+$')
+# Заранее сжатые копии рядом с файлом, в порядке предпочтения.
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def max_age():
+    return getattr(settings, 'FILES_MAX_AGE', 60 * 60)
+
+
+def offload():
+    """None, 'x-accel-redirect' (nginx) или 'x-sendfile' (Apache)."""
+    return getattr(settings, 'FILES_OFFLOAD', None)
+
+
+def accel_prefix():
+    return getattr(settings, 'FILES_ACCEL_PREFIX', '/protected/')
+
+
+def cache_control(path):
+    if HASHED_NAME.search(posixpath.basename(path)):
+        return f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    return f'public, max-age={max_age()}'
+
+
+def accepted_encodings(request):
+    header = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    accepted = set()
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        if params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00'):
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def choose_variant(request, fullpath):
+    """(путь, stat, Content-Encoding, есть ли сжатые копии) для ответа.
+
+    Диапазоны отдаются только из несжатого файла.
+    """
+    accepted = set()
+    if not request.META.get('HTTP_RANGE'):
+        accepted = accepted_encodings(request)
+    variants = False
+    for encoding, suffix in ENCODINGS:
+        try:
+            stat = os.stat(fullpath + suffix)
+        except OSError:
+            continue
+        variants = True
+        if encoding in accepted:
+            return fullpath + suffix, stat, encoding, variants
+    return fullpath, os.stat(fullpath), None, variants
+
+
+def make_etag(stat, encoding):
+    suffix = f'-{encoding}' if encoding else ''
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}{suffix}"'
+
+
+def strip_weak(etag):
+    return etag[2:] if etag.startswith('W/') else etag
+
+
+def not_modified(request, etag, mtime):
+    """Условный GET: If-None-Match, а без него If-Modified-Since."""
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        etags = {strip_weak(tag) for tag in parse_etags(if_none_match)}
+        return '*' in etags or etag in etags
+    since = parse_http_date_safe(
+        request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return since is not None and int(mtime) <= since
+
+
+def requested_range(request, etag, mtime, size):
+    """(начало, конец) из Range, None — отдать целиком, False — 416.
+
+    Поддерживается один диапазон; несколько диапазонов и Range, не
+    прошедший If-Range, дают обычный ответ 200 целиком.
+    """
+    header = request.META.get('HTTP_RANGE')
+    if not header:
+        return None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range and if_range != etag and (
+            parse_http_date_safe(if_range) != int(mtime)):
+        return None
+    match = RANGE.match(header.replace(' ', ''))
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last or int(last) == 0:
+            return False
+        return max(size - int(last), 0), size - 1
+    first = int(first)
+    last = min(int(last), size - 1) if last else size - 1
+    if first >= size or first > last:
+        return False
+    return first, last
+
+
+def read_range(path, first, last):
+    with open(path, 'rb') as file:
+        file.seek(first)
+        remaining = last - first + 1
+        while remaining > 0:
+            chunk = file.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def offloaded(fullpath, location, path, content_type):
+    """Пустой ответ, тело которого отдаст nginx или Apache."""
+    response = HttpResponse(content_type=content_type)
+    if offload() == 'x-sendfile':
+        response['X-Sendfile'] = fullpath
+    else:
+        response['X-Accel-Redirect'] = f'{accel_prefix()}{location}{path}'
+    response['Cache-Control'] = cache_control(path)
+    return response
+
+
+def serve(request, path, document_root, location):
+    """Отдаёт файл из document_root так, как это делал бы веб-сервер.
+
+    Сжатые заранее копии (.br, .gz), ETag и Last-Modified с ответом 304,
+    один диапазон Range с ответами 206 и 416, долгий immutable-кэш для
+    имён с хэшем содержимого. С FILES_OFFLOAD тело отдаёт фронтовой
+    сервер по X-Accel-Redirect (location под FILES_ACCEL_PREFIX) или
+    X-Sendfile, а Django только проверяет путь.
+    """
+    path = posixpath.normpath(path).lstrip('/')
+    try:
+        fullpath = safe_join(document_root, path)
+    except SuspiciousFileOperation:
+        raise Http404('Файл не найден')
+    if not os.path.isfile(fullpath):
+        raise Http404('Файл не найден')
+    content_type, _ = mimetypes.guess_type(fullpath)
+    content_type = content_type or 'application/octet-stream'
+    if offload():
+        return offloaded(fullpath, location, path, content_type)
+    fullpath, stat, encoding, variants = choose_variant(request, fullpath)
+    etag = make_etag(stat, encoding)
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(stat.st_mtime),
+        'Cache-Control': cache_control(path),
+        'Accept-Ranges': 'bytes',
+    }
+    if variants:
+        headers['Vary'] = 'Accept-Encoding'
+    if not_modified(request, etag, stat.st_mtime):
+        response = HttpResponseNotModified()
+    else:
+        response = file_response(request, fullpath, stat, etag, content_type)
+        if encoding:
+            response['Content-Encoding'] = encoding
+    for header, value in headers.items():
+        response[header] = value
+    return response
+
+
+def file_response(request, fullpath, stat, etag, content_type):
+    span = requested_range(request, etag, stat.st_mtime, stat.st_size)
+    if span is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{stat.st_size}'
+        return response
+    if span is None:
+        response = FileResponse(
+            open(fullpath, 'rb'), content_type=content_type)
+        response['Content-Length'] = stat.st_size
+        return response
+    first, last = span
+    response = StreamingHttpResponse(
+        read_range(fullpath, first, last), status=206,
+        content_type=content_type)
+    response['Content-Range'] = f'bytes {first}-{last}/{stat.st_size}'
+    response['Content-Length'] = last - first + 1
+    return response
+
+
+@cookieless
+def serve_media(request, path):
+    return serve(request, path, settings.MEDIA_ROOT, 'media/')
+
+
+@cookieless
+def serve_static(request, path):
+    return serve(request, path, settings.STATIC_ROOT, 'static/')
+
+
+def file_urlpatterns():
+    """Маршруты MEDIA_URL и STATIC_URL для раздачи через serve()."""
+    return [
+        re_path(
+            rf'^{re.escape(url.lstrip("/"))}(?P<path>.+)$', view)
+        for url, view in (
+            (settings.MEDIA_URL, serve_media),
+            (settings.STATIC_URL, serve_static),
+        )
+    ]
@@ -0,0 +1,60 @@
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from posts.models import Post
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает анонимные GET главной и страницы поста с быстрым путём '
+        'core.middleware и без него. Страницы прогреты в кэше, так что '
+        'разница — это работа мидлварей. Созданные данные откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            post = Post.objects.order_by('-pk').first()
+            if post is None:
+                author, _ = User.objects.get_or_create(username='bench')
+                post = Post.objects.create(text='Пост', author=author)
+            urls = {
+                'index': reverse('posts:index'),
+                'post_detail': reverse(
+                    'posts:post_detail', kwargs={'post_id': post.pk}),
+            }
+            for name, url in urls.items():
+                slow = self.measure(url, options['requests'], False)
+                fast = self.measure(url, options['requests'], True)
+                self.stdout.write(
+                    f'{name:>11}: обычный путь {slow["median"]:.3f} мс, '
+                    f'быстрый {fast["median"]:.3f} мс '
+                    f'({fast["median"] - slow["median"]:+.3f} мс), '
+                    f'Set-Cookie: {slow["cookies"]} / {fast["cookies"]}'
+                )
+            transaction.set_rollback(True)
+
+    def measure(self, url, count, fast):
+        with override_settings(COOKIELESS_FAST_PATH=fast):
+            client = Client()
+            client.get(url)
+            timings = []
+            cookies = 0
+            for _ in range(count):
+                client.cookies.clear()
+                started = time.perf_counter()
+                response = client.get(url)
+                timings.append((time.perf_counter() - started) * 1000)
+                cookies += bool(response.cookies)
+        return {'median': statistics.median(timings), 'cookies': cookies}
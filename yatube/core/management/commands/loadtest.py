@@ -0,0 +1,302 @@
+import json
+import random
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from http.cookies import SimpleCookie
+from io import BytesIO
+
+import requests
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from PIL import Image
+
+from core import singleflight
+from posts.models import Post
+
+User = get_user_model()
+
+# Сценарии нагрузки и их веса по умолчанию.
+SCENARIOS = {
+    'index': 70,
+    'follow_index': 15,
+    'post_create': 5,
+    'add_comment': 10,
+}
+# Сценарии анонимного чтения: отдельный клиент без сессии.
+ANONYMOUS = ('index',)
+PASSWORD = 'loadtest-password'
+
+
+class WSGIClient:
+    """Гоняет запросы прямо через WSGI-приложение из yatube/wsgi.py."""
+
+    def __init__(self, application):
+        self.application = application
+        self.cookies = {}
+
+    def request(self, method, path, data=None):
+        path, _, query = path.partition('?')
+        body = encode_multipart(BOUNDARY, data) if data else b''
+        environ = {
+            'REQUEST_METHOD': method,
+            'PATH_INFO': path,
+            'QUERY_STRING': query,
+            'SERVER_NAME': 'localhost',
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'HTTP_HOST': 'localhost',
+            'HTTP_COOKIE': '; '.join(
+                f'{key}={value}' for key, value in self.cookies.items()),
+            'CONTENT_TYPE': MULTIPART_CONTENT if data else '',
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+        if 'csrftoken' in self.cookies:
+            environ['HTTP_X_CSRFTOKEN'] = self.cookies['csrftoken']
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split()[0])
+            started['headers'] = headers
+
+        result = self.application(environ, start_response)
+        try:
+            for _ in result:
+                pass
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        for name, value in started['headers']:
+            if name.lower() == 'set-cookie':
+                for key, morsel in SimpleCookie(value).items():
+                    if morsel.value:
+                        self.cookies[key] = morsel.value
+                    else:
+                        self.cookies.pop(key, None)
+        return started['status']
+
+
+class HTTPClient:
+    """Те же запросы к уже запущенному локальному серверу."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.session = requests.Session()
+
+    def request(self, method, path, data=None):
+        headers = {'Referer': self.base_url + '/'}
+        token = self.session.cookies.get('csrftoken')
+        if token:
+            headers['X-CSRFToken'] = token
+        files = {
+            key: (value.name, value.read())
+            for key, value in (data or {}).items() if hasattr(value, 'read')
+        }
+        fields = {
+            key: value for key, value in (data or {}).items()
+            if key not in files
+        }
+        response = self.session.request(
+            method, self.base_url + path, data=fields or None,
+            files=files or None, headers=headers, allow_redirects=False,
+        )
+        return response.status_code
+
+
+def make_image():
+    buffer = BytesIO()
+    Image.new('RGB', (1200, 800), (70, 130, 180)).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+def login(client, username):
+    client.request('GET', '/auth/login/')
+    status = client.request('POST', '/auth/login/', {
+        'username': username, 'password': PASSWORD})
+    if status != 302:
+        raise CommandError(f'Не удалось войти как {username}: {status}')
+
+
+def run_scenario(name, client, context):
+    if name == 'index':
+        return client.request('GET', '/')
+    if name == 'follow_index':
+        return client.request('GET', '/follow/')
+    if name == 'post_create':
+        image = SimpleUploadedFile('load.jpg', context['image'])
+        return client.request('POST', '/create/', {
+            'text': 'Пост под нагрузкой', 'image': image})
+    if name == 'add_comment':
+        return client.request(
+            'POST', f'/posts/{context["post_id"]}/comment/',
+            {'text': 'Комментарий под нагрузкой'})
+    raise CommandError(f'Неизвестный сценарий {name}')
+
+
+def make_client(options):
+    if options['url']:
+        return HTTPClient(options['url'])
+    from yatube.wsgi import application
+    return WSGIClient(application)
+
+
+def worker(number, options, context):
+    """Один поток или процесс: свои клиенты, свой генератор случайностей.
+
+    Анонимные сценарии идут через клиент без сессии, остальные — через
+    клиент, который один раз входит как пользователь нагрузки.
+    """
+    rnd = random.Random(options['seed'] + number)
+    names = list(context['weights'])
+    clients = {True: make_client(options)}
+    if any(name not in ANONYMOUS for name in names):
+        clients[False] = make_client(options)
+        login(clients[False], context['username'])
+    weights = [context['weights'][name] for name in names]
+    deadline = time.perf_counter() + options['duration']
+    samples = []
+    for _ in range(options['requests'] // options['workers']):
+        if options['duration'] and time.perf_counter() > deadline:
+            break
+        name = rnd.choices(names, weights)[0]
+        started = time.perf_counter()
+        try:
+            client = clients[name in ANONYMOUS]
+            ok = run_scenario(name, client, context) < 400
+        except Exception:
+            ok = False
+        samples.append((name, time.perf_counter() - started, ok))
+    connections.close_all()
+    return samples
+
+
+def percentile(values, share):
+    if not values:
+        return None
+    index = min(len(values) - 1, max(0, round(share * len(values)) - 1))
+    return round(values[index] * 1000, 2)
+
+
+def summarize(samples, elapsed):
+    latencies = sorted(latency for _, latency, _ in samples)
+    errors = sum(1 for _, _, ok in samples if not ok)
+    return {
+        'requests': len(samples),
+        'rps': round(len(samples) / elapsed, 2) if elapsed else None,
+        'error_rate': round(errors / len(samples), 4) if samples else 0,
+        'latency_ms': {
+            'p50': percentile(latencies, 0.50),
+            'p95': percentile(latencies, 0.95),
+            'p99': percentile(latencies, 0.99),
+        },
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный прогон сценариев Yatube: через WSGI в процессе или '
+        'по HTTP к локальному серверу. Печатает задержки p50/p95/p99, '
+        'RPS и долю ошибок в JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='',
+                            help='Адрес сервера; пусто — WSGI в процессе')
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--pool', choices=('thread', 'process'),
+                            default='thread')
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--duration', type=float, default=0,
+                            help='Ограничение по времени, секунд')
+        parser.add_argument('--scenarios', default='',
+                            help='Веса, например index=80,add_comment=20')
+        parser.add_argument('--username', default='loadtest')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', default='',
+                            help='Файл для JSON; по умолчанию stdout')
+
+    def handle(self, *args, **options):
+        context = {
+            'weights': self.weights(options['scenarios']),
+            'username': self.prepare_user(options['username']),
+            'image': make_image(),
+        }
+        post = Post.objects.order_by('-pk').first()
+        if post is None:
+            post = Post.objects.create(
+                text='Пост для нагрузки',
+                author=User.objects.get(username=context['username']))
+        context['post_id'] = post.pk
+        connections.close_all()
+
+        pool = (ProcessPoolExecutor if options['pool'] == 'process'
+                else ThreadPoolExecutor)
+        started = time.perf_counter()
+        with pool(max_workers=options['workers']) as executor:
+            futures = [
+                executor.submit(worker, number, options, context)
+                for number in range(options['workers'])
+            ]
+            samples = [sample for future in futures
+                       for sample in future.result()]
+        elapsed = time.perf_counter() - started
+
+        by_scenario = defaultdict(list)
+        for sample in samples:
+            by_scenario[sample[0]].append(sample)
+        report = {
+            'target': options['url'] or 'wsgi',
+            'pool': options['pool'],
+            'workers': options['workers'],
+            'duration_s': round(elapsed, 3),
+            **summarize(samples, elapsed),
+            'scenarios': {
+                name: summarize(rows, elapsed)
+                for name, rows in sorted(by_scenario.items())
+            },
+        }
+        stats = getattr(cache, 'stats', None)
+        if stats is not None and not options['url'] \
+                and options['pool'] == 'thread':
+            # Попадания по ярусам видны только из этого же процесса.
+            report['cache'] = stats()
+            report['singleflight'] = singleflight.stats()
+        output = json.dumps(report, indent=2, ensure_ascii=False)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+    def weights(self, spec):
+        if not spec:
+            return dict(SCENARIOS)
+        weights = {}
+        for item in spec.split(','):
+            name, _, weight = item.partition('=')
+            if name not in SCENARIOS:
+                raise CommandError(f'Неизвестный сценарий {name}')
+            weights[name] = float(weight or 1)
+        return weights
+
+    def prepare_user(self, username):
+        """Пользователь нагрузки с известным паролем и одной подпиской."""
+        user, _ = User.objects.get_or_create(username=username)
+        user.set_password(PASSWORD)
+        user.save()
+        author = User.objects.exclude(pk=user.pk).first()
+        if author is not None:
+            user.follower.get_or_create(author=author)
+        return username
@@ -0,0 +1,64 @@
+from django.conf import settings
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.messages.middleware import MessageMiddleware
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.middleware.csrf import CsrfViewMiddleware
+from django.urls import Resolver404, resolve
+
+SAFE_METHODS = ('GET', 'HEAD')
+
+
+def fast_path_enabled():
+    return getattr(settings, 'COOKIELESS_FAST_PATH', True)
+
+
+class CookielessMiddleware:
+    """Быстрый путь для анонимного чтения без сессионной куки.
+
+    Для безопасных запросов к view с @cookieless ставит request.user =
+    AnonymousUser и помечает запрос: сессии, CSRF, аутентификация и
+    сообщения из этого модуля его пропускают. Ответ уходит без Set-Cookie,
+    поэтому его может кэшировать и прокси перед сайтом.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.cookieless = self.is_cookieless(request)
+        if not request.cookieless:
+            return self.get_response(request)
+        request.user = AnonymousUser()
+        response = self.get_response(request)
+        response.cookies.clear()
+        return response
+
+    def is_cookieless(self, request):
+        if not fast_path_enabled() or request.method not in SAFE_METHODS:
+            return False
+        if settings.SESSION_COOKIE_NAME in request.COOKIES:
+            return False
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return False
+        return getattr(match.func, 'cookieless', False)
+
+
+def skip_cookieless(middleware):
+    """Та же мидлварь, но запросы быстрого пути идут мимо неё."""
+    class Skipping(middleware):
+        def __call__(self, request):
+            if getattr(request, 'cookieless', False):
+                return self.get_response(request)
+            return super().__call__(request)
+
+    Skipping.__name__ = Skipping.__qualname__ = middleware.__name__
+    return Skipping
+
+
+SessionMiddleware = skip_cookieless(SessionMiddleware)
+CsrfViewMiddleware = skip_cookieless(CsrfViewMiddleware)
+AuthenticationMiddleware = skip_cookieless(AuthenticationMiddleware)
+MessageMiddleware = skip_cookieless(MessageMiddleware)
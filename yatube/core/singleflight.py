@@ -0,0 +1,117 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+POLL_INTERVAL = 0.01
+
+_flights = {}
+_flights_lock = threading.Lock()
+_stats = {'fresh': 0, 'stale': 0, 'coalesced': 0, 'computed': 0}
+_stats_lock = threading.Lock()
+
+
+def stale_timeout():
+    return getattr(settings, 'SINGLEFLIGHT_STALE_TIMEOUT', 60)
+
+
+def lock_timeout():
+    return getattr(settings, 'SINGLEFLIGHT_LOCK_TIMEOUT', 10)
+
+
+def stats():
+    """Сколько запросов получили свежую копию, устаревшую, дождались
+    чужого пересчёта (coalesced) или считали сами (computed)."""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def flight_key(key):
+    return f'flight:{key}'
+
+
+def acquire(key):
+    """Право пересчитать ключ: один поток в процессе и один процесс."""
+    with _flights_lock:
+        lock = _flights.setdefault(key, threading.Lock())
+    if not lock.acquire(blocking=False):
+        return None
+    if not cache.add(flight_key(key), 1, lock_timeout()):
+        lock.release()
+        return None
+    return lock
+
+
+def release(key, lock):
+    cache.delete(flight_key(key))
+    with _flights_lock:
+        _flights.pop(key, None)
+    lock.release()
+
+
+def compute_and_store(key, compute, timeout, stale):
+    count('computed')
+    value = compute()
+    if value is not None:
+        cache.set(key, (value, time.time() + timeout), timeout + stale)
+    return value
+
+
+def compute_locked(key, lock, compute, timeout, stale):
+    try:
+        return compute_and_store(key, compute, timeout, stale)
+    finally:
+        release(key, lock)
+
+
+def wait_for(key, compute, timeout, stale):
+    """Ждёт чужой пересчёт; если он закончился без записи, считает сам.
+
+    Пересчёт мог упасть или вернуть None: тогда блокировки уже нет, а
+    значения всё ещё нет, и ждать до SINGLEFLIGHT_LOCK_TIMEOUT бессмысленно.
+    """
+    deadline = time.monotonic() + lock_timeout()
+    while time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            count('coalesced')
+            return entry[0]
+        if cache.get(flight_key(key)) is None:
+            lock = acquire(key)
+            if lock is not None:
+                return compute_locked(key, lock, compute, timeout, stale)
+    return compute_and_store(key, compute, timeout, stale)
+
+
+def cached_call(key, compute, timeout, stale=None):
+    """Значение из кэша, которое пересчитывает только один запрос.
+
+    timeout — мягкий срок: после него копия считается устаревшей, её
+    пересчитывает первый пришедший, а остальные пока получают старую.
+    Жёсткий срок — timeout + stale: после него копии нет, и остальные
+    ждут пересчёта до SINGLEFLIGHT_LOCK_TIMEOUT, а не считают сами.
+    None из compute не кэшируется; если пересчёт вернул None или упал,
+    следующим считает один из ждущих.
+    """
+    if stale is None:
+        stale = stale_timeout()
+    entry = cache.get(key)
+    if entry is not None:
+        value, fresh_until = entry
+        if time.time() < fresh_until:
+            count('fresh')
+            return value
+    lock = acquire(key)
+    if lock is not None:
+        return compute_locked(key, lock, compute, timeout, stale)
+    if entry is not None:
+        count('stale')
+        return entry[0]
+    return wait_for(key, compute, timeout, stale)
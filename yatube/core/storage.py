@@ -0,0 +1,153 @@
+import gzip
+import hashlib
+import os
+import posixpath
+import time
+from contextlib import contextmanager
+
+from django.contrib.staticfiles.storage import (
+    ManifestStaticFilesStorage, StaticFilesStorage)
+from django.core.files import File, locks
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Что имеет смысл сжимать заранее; картинки и шрифты уже сжаты.
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.txt', '.xml', '.map',
+                '.html', '.ico')
+MIN_COMPRESS_SIZE = 256
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Файлы называются по SHA-256 содержимого, одинаковые хранятся раз.
+
+    Из исходного имени остаются каталог (upload_to) и расширение:
+    posts/photo.JPG превращается в posts/ab/ab…cd.jpg. Файл с таким
+    содержимым, уже лежащий в хранилище, повторно не пишется. Адрес
+    файла не меняется, пока не меняется содержимое, поэтому его можно
+    кэшировать навсегда. Удаляет файлы тот, кто знает о ссылках на них,
+    см. posts.images.release_image.
+
+    Запись и удаление одного файла идут под flock-блокировкой его
+    каталога. Каждое повторное использование дописывает байт в отметку
+    name.claim: ссылка на файл может быть ещё в незакоммиченной
+    транзакции, и удаляющий её не видит. После коммита ссылки байт
+    снимает settle(). Файл, удалённый до save(), записывается заново.
+    """
+    lock_name = '.lock'
+    claim_suffix = '.claim'
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.content_name(name, content)
+        with self.locked(name):
+            if self.exists(name):
+                self.claim(name)
+                return name
+            return self._save(name, content)
+
+    @contextmanager
+    def locked(self, name):
+        directory = os.path.dirname(self.path(name))
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, self.lock_name), 'ab') as file:
+            locks.lock(file, locks.LOCK_EX)
+            try:
+                yield
+            finally:
+                locks.unlock(file)
+
+    def claim(self, name):
+        with open(self.path(name) + self.claim_suffix, 'ab') as file:
+            file.write(b'.')
+
+    def settle(self, name):
+        """Снимает одну отметку: ссылка на файл закоммичена."""
+        path = self.path(name) + self.claim_suffix
+        with self.locked(name):
+            try:
+                claims = os.path.getsize(path)
+            except FileNotFoundError:
+                return
+            if claims > 1:
+                os.truncate(path, claims - 1)
+            else:
+                os.remove(path)
+
+    def claimed_within(self, name, seconds):
+        """Брали ли файл повторно за последние seconds секунд."""
+        try:
+            claimed = os.path.getmtime(self.path(name) + self.claim_suffix)
+        except FileNotFoundError:
+            return False
+        return time.time() - claimed < seconds
+
+    def delete(self, name):
+        super().delete(name)
+        super().delete(name + self.claim_suffix)
+
+    def content_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        directory, filename = posixpath.split(name)
+        extension = posixpath.splitext(filename)[1].lower()
+        hexdigest = digest.hexdigest()
+        return posixpath.join(
+            directory, hexdigest[:2], f'{hexdigest}{extension}')
+
+
+def compressed_variants(content):
+    """[(суффикс, байты)] сжатых копий, которые меньше оригинала."""
+    variants = [('.gz', gzip.compress(content, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append(('.br', brotli.compress(content)))
+    return [
+        (suffix, data) for suffix, data in variants
+        if len(data) < len(content) * 0.95
+    ]
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Статика с хэшем в имени и сжатыми копиями .gz (и .br с brotli).
+
+    Копии пишет collectstatic, отдаёт их core.files.serve или фронтовой
+    сервер (gzip_static/brotli_static в nginx). Без манифеста, то есть до
+    collectstatic, например в тестах, адреса остаются без хэша.
+    """
+    manifest_strict = False
+
+    def url(self, name, force=False):
+        try:
+            return super().url(name, force)
+        except ValueError:
+            return StaticFilesStorage.url(self, name)
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        names = set(paths) | set(self.hashed_files.values())
+        for name in sorted(names):
+            if name.lower().endswith(COMPRESSIBLE) and self.exists(name):
+                self.compress(name)
+
+    def compress(self, name):
+        with self.open(name) as original:
+            content = original.read()
+        if len(content) < MIN_COMPRESS_SIZE:
+            return
+        for suffix, data in compressed_variants(content):
+            if self.exists(name + suffix):
+                self.delete(name + suffix)
+            self._save(name + suffix, ContentFile(data))
@@ -0,0 +1,41 @@
+from django import template
+from django.core.cache.utils import make_template_fragment_key
+
+from ..singleflight import cached_call
+
+register = template.Library()
+
+
+class SingleFlightNode(template.Node):
+    def __init__(self, nodelist, timeout, fragment_name, vary_on):
+        self.nodelist = nodelist
+        self.timeout = timeout
+        self.fragment_name = fragment_name
+        self.vary_on = vary_on
+
+    def render(self, context):
+        timeout = int(self.timeout.resolve(context))
+        vary_on = [var.resolve(context) for var in self.vary_on]
+        key = make_template_fragment_key(self.fragment_name, vary_on)
+        return cached_call(
+            key, lambda: self.nodelist.render(context), timeout)
+
+
+@register.tag
+def cache_singleflight(parser, token):
+    """Как {% cache %}, но истёкший фрагмент пересчитывает один запрос.
+
+    {% cache_singleflight timeout name [var1 var2 ...] %}
+    """
+    nodelist = parser.parse(('endcache_singleflight',))
+    parser.delete_first_token()
+    tokens = token.split_contents()
+    if len(tokens) < 3:
+        raise template.TemplateSyntaxError(
+            f'{tokens[0]} принимает как минимум два аргумента')
+    return SingleFlightNode(
+        nodelist,
+        parser.compile_filter(tokens[1]),
+        tokens[2],
+        [parser.compile_filter(token) for token in tokens[3:]],
+    )
@@ -0,0 +1,21 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+register = template.Library()
+
+PLACEHOLDER = '<!--user-fragment:{}-->'
+
+
+@register.simple_tag(takes_context=True)
+def user_fragment(context, template_name):
+    """Подключает шаблон, зависящий от пользователя.
+
+    Если страница рендерится для общего кэша, вместо шаблона остаётся
+    метка, которую core.decorators.cache_shared_page заменит при отдаче.
+    """
+    request = context.get('request')
+    if getattr(request, 'defer_user_fragments', False):
+        return mark_safe(PLACEHOLDER.format(template_name))
+    fragment = context.template.engine.get_template(template_name)
+    with context.push():
+        return fragment.render(context)
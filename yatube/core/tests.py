@@ -1,4 +1,30 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import time
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import BACKEND_SESSION_KEY, get_user_model
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import (SimpleTestCase, TestCase, TransactionTestCase,
+                         override_settings)
+from django.templatetags.static import static
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from . import cache as tiered
+from .auth import user_cache_key
+from .storage import ContentAddressedStorage
+from . import singleflight
 
 
 class ViewTestClass(TestCase):
@@ -6,3 +32,440 @@ class ViewTestClass(TestCase):
         response = self.client.get('/nonexist-page/')
         self.assertEqual(response.status_code, 404)
         self.assertTemplateUsed(response, 'core/404.html')
+
+
+class CachedAuthTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            username='reader', password='old-password')
+        self.client.force_login(self.user)
+        self.client.get(reverse('posts:post_create'))
+
+    def queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        return response, [query['sql'] for query in queries]
+
+    def test_warm_request_skips_session_and_user_rows(self):
+        response, queries = self.queries(reverse('posts:post_create'))
+        self.assertEqual(response.wsgi_request.user, self.user)
+        for sql in queries:
+            self.assertNotIn('django_session', sql)
+            self.assertNotIn('auth_user', sql)
+
+    def test_user_edit_is_seen_by_next_request(self):
+        self.user.first_name = 'Новое'
+        self.user.save()
+        response, _ = self.queries(reverse('posts:post_create'))
+        self.assertEqual(response.wsgi_request.user.first_name, 'Новое')
+
+    def test_password_change_logs_out_other_sessions(self):
+        other = self.client_class()
+        other.force_login(self.user)
+        other.get(reverse('posts:post_create'))
+        response = self.client.post(reverse('users:password_change'), {
+            'old_password': 'old-password',
+            'new_password1': 'new-Pa55word',
+            'new_password2': 'new-Pa55word',
+        })
+        self.assertEqual(response.status_code, 302)
+        response, _ = self.queries(reverse('posts:post_create'))
+        self.assertTrue(response.wsgi_request.user.is_authenticated)
+        response = other.get(reverse('posts:post_create'))
+        self.assertFalse(response.wsgi_request.user.is_authenticated)
+
+    def test_password_hash_is_not_cached(self):
+        fields, _ = cache.get(user_cache_key(self.user.pk))
+        self.assertNotIn('password', fields)
+        self.assertNotIn(self.user.password, pickle.dumps(fields).decode(
+            'latin-1'))
+
+    def test_saving_cached_user_keeps_password(self):
+        response, _ = self.queries(reverse('posts:post_create'))
+        user = response.wsgi_request.user
+        user.first_name = 'Новое'
+        user.save()
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('old-password'))
+
+    def test_sessions_of_plain_model_backend_stay_valid(self):
+        client = self.client_class()
+        client.force_login(
+            self.user, backend='django.contrib.auth.backends.ModelBackend')
+        response = client.get(reverse('posts:post_create'))
+        self.assertTrue(response.wsgi_request.user.is_authenticated)
+
+    def test_new_logins_use_cached_backend(self):
+        client = self.client_class()
+        client.post(reverse('users:login'), {
+            'username': 'reader', 'password': 'old-password'})
+        self.assertEqual(client.session[BACKEND_SESSION_KEY],
+                         'core.auth.CachedModelBackend')
+
+    def test_logout_drops_cached_session(self):
+        self.client.get(reverse('users:logout'))
+        response = self.client.get(reverse('posts:post_create'))
+        self.assertFalse(response.wsgi_request.user.is_authenticated)
+
+
+class CookielessFastPathTests(TestCase):
+    def test_anonymous_reads_skip_session_and_cookies(self):
+        response = self.client.get(reverse('posts:index'))
+        self.assertTrue(response.wsgi_request.cookieless)
+        self.assertFalse(hasattr(response.wsgi_request, 'session'))
+        self.assertFalse(response.cookies)
+
+    def test_sessions_and_forms_keep_full_stack(self):
+        """С сессией и на страницах с формами работает обычный путь."""
+        response = self.client.get(reverse('users:login'))
+        self.assertFalse(response.wsgi_request.cookieless)
+        self.assertIn('csrftoken', response.cookies)
+        self.client.cookies['sessionid'] = 'stale'
+        response = self.client.get(reverse('posts:index'))
+        self.assertFalse(response.wsgi_request.cookieless)
+        self.assertTrue(hasattr(response.wsgi_request, 'session'))
+
+
+class LoadTestCommandTests(TransactionTestCase):
+    def test_loadtest_reports_percentiles(self):
+        """Прогон через WSGI отдаёт JSON с перцентилями и ошибками."""
+        out = StringIO()
+        call_command('loadtest', workers=1, requests=8, stdout=out,
+                     scenarios='index=1,add_comment=1')
+        report = json.loads(out.getvalue())
+        self.assertEqual(report['requests'], 8)
+        self.assertEqual(report['error_rate'], 0)
+        self.assertEqual(set(report['latency_ms']), {'p50', 'p95', 'p99'})
+        self.assertLessEqual(set(report['scenarios']),
+                             {'index', 'add_comment'})
+
+    def test_anonymous_scenarios_run_without_session(self):
+        """index идёт анонимно: никто не входит и сессий не появляется."""
+        call_command('loadtest', workers=1, requests=4, stdout=StringIO(),
+                     scenarios='index=1')
+        self.assertFalse(Session.objects.exists())
+
+
+class ContentAddressedStorageTests(SimpleTestCase):
+    def setUp(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        self.storage = ContentAddressedStorage(location)
+
+    def test_same_content_is_stored_once(self):
+        first = self.storage.save('posts/a.GIF', ContentFile(b'gif'))
+        second = self.storage.save('posts/b.gif', ContentFile(b'gif'))
+        other = self.storage.save('posts/c.gif', ContentFile(b'png'))
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+        self.assertRegex(first, r'^posts/[0-9a-f]{2}/[0-9a-f]{64}\.gif$')
+        folder = self.storage.path(first).rsplit('/', 1)[0]
+        self.assertEqual(
+            [name for name in self.storage.listdir(folder)[1]
+             if name.endswith('.gif')],
+            [first.rsplit('/', 1)[1]],
+        )
+
+    def test_reused_file_is_claimed(self):
+        name = self.storage.save('posts/a.gif', ContentFile(b'gif'))
+        self.assertFalse(self.storage.claimed_within(name, 60))
+        self.storage.save('posts/b.gif', ContentFile(b'gif'))
+        self.storage.save('posts/c.gif', ContentFile(b'gif'))
+        self.assertTrue(self.storage.claimed_within(name, 60))
+        self.storage.settle(name)
+        self.assertTrue(self.storage.claimed_within(name, 60))
+        self.storage.settle(name)
+        self.assertFalse(self.storage.claimed_within(name, 60))
+        self.storage.save('posts/d.gif', ContentFile(b'gif'))
+        self.storage.delete(name)
+        self.assertFalse(self.storage.claimed_within(name, 60))
+
+    def test_file_deleted_before_reuse_is_written_again(self):
+        name = self.storage.save('posts/a.gif', ContentFile(b'gif'))
+        self.storage.delete(name)
+        self.storage.save('posts/b.gif', ContentFile(b'gif'))
+        with self.storage.open(name) as file:
+            self.assertEqual(file.read(), b'gif')
+
+
+class FileServingTests(SimpleTestCase):
+    HASHED = 'posts/ab/' + 'ab' * 32 + '.css'
+
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        self.media = os.path.join(root, 'media')
+        self.static = os.path.join(root, 'static')
+        self.content = b'body { color: red; }\n' * 50
+        self.write(self.media, 'plain.css', self.content)
+        self.write(self.media, self.HASHED, self.content)
+        self.write(self.media, 'plain.css.gz', gzip.compress(self.content))
+        self.write(self.static, 'style.0123456789ab.css', self.content)
+        settings = override_settings(
+            MEDIA_ROOT=self.media, STATIC_ROOT=self.static)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def write(self, root, name, content):
+        path = os.path.join(root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file:
+            file.write(content)
+
+    def test_cache_control_depends_on_hashed_name(self):
+        plain = self.client.get('/media/plain.css')
+        self.assertEqual(b''.join(plain.streaming_content), self.content)
+        self.assertEqual(plain['Cache-Control'], 'public, max-age=3600')
+        for url in ('/media/' + self.HASHED,
+                    '/static/style.0123456789ab.css'):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('immutable', response['Cache-Control'])
+            self.assertFalse(response.cookies)
+
+    def test_not_modified(self):
+        response = self.client.get('/media/plain.css')
+        again = self.client.get(
+            '/media/plain.css', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(again.status_code, 304)
+        since = self.client.get(
+            '/media/plain.css',
+            HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(since.status_code, 304)
+
+    def test_precompressed_variant(self):
+        response = self.client.get(
+            '/media/plain.css', HTTP_ACCEPT_ENCODING='br;q=0, gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        body = b''.join(response.streaming_content)
+        self.assertEqual(gzip.decompress(body), self.content)
+        identity = self.client.get('/media/plain.css')
+        self.assertFalse(identity.has_header('Content-Encoding'))
+        self.assertEqual(identity['Vary'], 'Accept-Encoding')
+
+    def test_ranges(self):
+        response = self.client.get(
+            '/media/plain.css', HTTP_RANGE='bytes=5-9',
+            HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 206)
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(b''.join(response.streaming_content),
+                         self.content[5:10])
+        self.assertEqual(response['Content-Range'],
+                         f'bytes 5-9/{len(self.content)}')
+        suffix = self.client.get('/media/plain.css', HTTP_RANGE='bytes=-4')
+        self.assertEqual(b''.join(suffix.streaming_content),
+                         self.content[-4:])
+        unsatisfiable = self.client.get(
+            '/media/plain.css', HTTP_RANGE=f'bytes={len(self.content)}-')
+        self.assertEqual(unsatisfiable.status_code, 416)
+        stale = self.client.get(
+            '/media/plain.css', HTTP_RANGE='bytes=5-9',
+            HTTP_IF_RANGE='"stale"')
+        self.assertEqual(stale.status_code, 200)
+
+    def test_missing_and_traversal(self):
+        for url in ('/media/missing.css', '/media/../../etc/passwd',
+                    '/media/posts'):
+            self.assertEqual(self.client.get(url).status_code, 404)
+
+    @override_settings(FILES_OFFLOAD='x-accel-redirect')
+    def test_offload(self):
+        response = self.client.get('/media/' + self.HASHED)
+        self.assertEqual(response['X-Accel-Redirect'],
+                         '/protected/media/' + self.HASHED)
+        self.assertEqual(response.content, b'')
+        with override_settings(FILES_OFFLOAD='x-sendfile'):
+            response = self.client.get('/static/style.0123456789ab.css')
+        self.assertEqual(
+            response['X-Sendfile'],
+            os.path.join(self.static, 'style.0123456789ab.css'))
+
+    def test_collectstatic_writes_hashed_and_compressed_files(self):
+        source = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, source, ignore_errors=True)
+        self.write(source, 'css/site.css', self.content)
+        with override_settings(STATICFILES_DIRS=[source]):
+            call_command('collectstatic', interactive=False,
+                         verbosity=0)
+            url = static('css/site.css')
+        self.assertRegex(url, r'^/static/css/site\.[0-9a-f]{12}\.css$')
+        name = url[len('/static/'):]
+        with open(os.path.join(self.static, name + '.gz'), 'rb') as file:
+            self.assertEqual(gzip.decompress(file.read()), self.content)
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('immutable', response['Cache-Control'])
+
+
+class TieredCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.location, ignore_errors=True)
+
+    def worker(self, **options):
+        """Отдельный экземпляр бэкенда — как кэш другого процесса."""
+        cache = tiered.TieredCache(self.location, {'OPTIONS': {
+            'LOCAL_KEY_PREFIXES': ('page:',), **options}})
+        # Память яруса общая на процесс; следующий экземпляр получит свою.
+        for registry in (tiered._locals, tiered._locks, tiered._stats):
+            registry.clear()
+        return cache
+
+    def test_versioned_keys_are_served_from_memory(self):
+        first, second = self.worker(), self.worker()
+        first.set('page:1', 'html')
+        self.assertEqual(second.get('page:1'), 'html')
+        self.assertEqual(second.get('page:1'), 'html')
+        self.assertEqual(second.stats()['local']['hits'], 1)
+        self.assertEqual(second.stats()['shared']['hits'], 1)
+
+    def test_counters_cross_workers(self):
+        first, second = self.worker(), self.worker()
+        first.set('version', 1)
+        self.assertEqual(second.get('version'), 1)
+        first.incr('version')
+        self.assertEqual(second.get('version'), 2)
+        self.assertEqual(second.stats()['local']['hits'], 0)
+
+    def test_incr_keeps_timeout(self):
+        cache = self.worker()
+        cache.set('count', 1, 60 * 60 * 24)
+        cache.incr('count')
+        fname = cache.shared._key_to_file('count')
+        with open(fname, 'rb') as file:
+            expiry = pickle.load(file)
+        self.assertGreater(expiry - time.time(), 60 * 60 * 23)
+        cache.set('forever', 1, None)
+        self.assertEqual(cache.incr('forever', 2), 3)
+        with self.assertRaises(ValueError):
+            cache.incr('missing')
+
+    def test_add_and_incr_are_atomic_across_workers(self):
+        caches = [self.worker() for _ in range(4)]
+        caches[0].set('count', 0, None)
+        added = []
+
+        def hammer(cache):
+            added.append(cache.add('lock', 'mine'))
+            for _ in range(25):
+                cache.incr('count')
+
+        threads = [threading.Thread(target=hammer, args=(cache,))
+                   for cache in caches]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(caches[0].get('count'), 100)
+        self.assertEqual(added.count(True), 1)
+
+    def test_writes_do_not_scan_the_directory(self):
+        cache = self.worker()
+        shared = cache.shared
+        with mock.patch.object(shared, '_list_cache_files',
+                               wraps=shared._list_cache_files) as scans:
+            for i in range(20):
+                cache.set(f'key:{i}', i)
+                cache.add(f'lock:{i}', i)
+        self.assertLessEqual(scans.call_count, 1)
+
+    def test_due_cull_still_bounds_entries(self):
+        cache = self.worker(SHARED_OPTIONS={
+            'MAX_ENTRIES': 10, 'CULL_FREQUENCY': 2, 'CULL_INTERVAL': 0})
+        for i in range(30):
+            cache.set(f'key:{i}', i)
+        self.assertLessEqual(len(cache.shared._list_cache_files()), 10)
+
+    def test_local_tier_is_bounded(self):
+        cache = self.worker(LOCAL_MAX_ENTRIES=2)
+        cache.set_many({f'page:{i}': i for i in range(3)})
+        self.assertEqual(cache.stats()['local']['entries'], 2)
+        self.assertEqual(cache.get_many(['page:0', 'page:2']),
+                         {'page:0': 0, 'page:2': 2})
+        self.assertEqual(cache.stats()['local'],
+                         {'hits': 1, 'misses': 1, 'entries': 2})
+
+
+class SingleFlightTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+
+    def slow_compute(self):
+        self.calls += 1
+        time.sleep(0.2)
+        return 'value'
+
+    def test_cold_key_is_computed_once(self):
+        """Параллельные промахи ждут один пересчёт, а не считают сами."""
+        before = singleflight.stats()
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(
+                singleflight.cached_call('hot', self.slow_compute, 60)))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        after = singleflight.stats()
+        self.assertEqual(results, ['value'] * 8)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(after['coalesced'] - before['coalesced'], 7)
+
+    def run_concurrently(self, compute, count=4):
+        outcomes = []
+
+        def call():
+            started = time.monotonic()
+            try:
+                outcome = singleflight.cached_call('hot', compute, 60)
+            except LookupError as error:
+                outcome = error
+            outcomes.append((outcome, time.monotonic() - started))
+
+        threads = [threading.Thread(target=call) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return outcomes
+
+    def test_failed_compute_does_not_stall_waiters(self):
+        """Упавший пересчёт: ждущие не сидят до SINGLEFLIGHT_LOCK_TIMEOUT."""
+        def failing():
+            self.calls += 1
+            time.sleep(0.1)
+            raise LookupError('нет страницы')
+
+        outcomes = self.run_concurrently(failing)
+        self.assertEqual(self.calls, 4)
+        for outcome, elapsed in outcomes:
+            self.assertIsInstance(outcome, LookupError)
+            self.assertLess(elapsed, 2)
+
+    def test_none_is_not_awaited(self):
+        def nothing():
+            self.calls += 1
+            time.sleep(0.1)
+
+        outcomes = self.run_concurrently(nothing)
+        self.assertEqual([outcome for outcome, _ in outcomes], [None] * 4)
+        self.assertLess(max(elapsed for _, elapsed in outcomes), 2)
+
+    def test_expired_key_is_served_stale_while_refreshing(self):
+        cache.set('hot', ('old', time.time() - 1), 60)
+        lock = singleflight.acquire('hot')
+        try:
+            value = singleflight.cached_call('hot', self.slow_compute, 60)
+        finally:
+            singleflight.release('hot', lock)
+        self.assertEqual(value, 'old')
+        self.assertEqual(self.calls, 0)
+        self.assertEqual(
+            singleflight.cached_call('hot', self.slow_compute, 60), 'value')
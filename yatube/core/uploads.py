@@ -0,0 +1,87 @@
+import warnings
+
+from django.conf import settings
+from django.core.files.uploadhandler import (SkipFile,
+                                             TemporaryFileUploadHandler)
+from django.template.defaultfilters import filesizeformat
+from PIL import Image
+
+# Сколько байт читать, пока Pillow не найдёт в заголовке размеры картинки.
+HEADER_LIMIT = 1024 * 1024
+
+
+def max_file_size():
+    return getattr(settings, 'UPLOAD_MAX_FILE_SIZE', 10 * 1024 * 1024)
+
+
+def max_image_pixels():
+    return getattr(settings, 'UPLOAD_MAX_IMAGE_PIXELS', 40 * 1000 * 1000)
+
+
+def upload_errors(request):
+    """Файлы, которые BoundedUploadHandler не принял: {поле: причина}."""
+    request.FILES
+    return getattr(request, 'upload_errors', {})
+
+
+def image_pixels(path):
+    """Пиксели по заголовку без декодирования; None, если не картинка."""
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', Image.DecompressionBombWarning)
+            with Image.open(path) as image:
+                width, height = image.size
+    except Image.DecompressionBombError:
+        return float('inf')
+    except Exception:
+        return None
+    return width * height
+
+
+class BoundedUploadHandler(TemporaryFileUploadHandler):
+    """Загрузка сразу на диск с ограничением размера файла и картинки.
+
+    Файл больше UPLOAD_MAX_FILE_SIZE или картинка больше
+    UPLOAD_MAX_IMAGE_PIXELS по заголовку отбрасываются, не дописываясь
+    на диск и не декодируясь; причина остаётся в request.upload_errors,
+    а форма показывает её как ошибку поля, см. upload_errors().
+    """
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        self.received = 0
+        self.header_checked = False
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > max_file_size():
+            self.reject(f'Файл больше {filesizeformat(max_file_size())}')
+        super().receive_data_chunk(raw_data, start)
+        if not self.header_checked:
+            self.check_header(final=self.received >= HEADER_LIMIT)
+        return None
+
+    def file_complete(self, file_size):
+        if not self.header_checked:
+            try:
+                self.check_header(final=True)
+            except SkipFile:
+                self.file.close()
+                return None
+        return super().file_complete(file_size)
+
+    def check_header(self, final):
+        self.file.flush()
+        pixels = image_pixels(self.file.temporary_file_path())
+        if pixels is None and not final:
+            return
+        self.header_checked = True
+        if pixels is not None and pixels > max_image_pixels():
+            megapixels = max_image_pixels() // (1000 * 1000)
+            self.reject(f'Картинка больше {megapixels} мегапикселей')
+
+    def reject(self, message):
+        if not hasattr(self.request, 'upload_errors'):
+            self.request.upload_errors = {}
+        self.request.upload_errors[self.field_name] = message
+        raise SkipFile(message)
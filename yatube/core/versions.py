@@ -0,0 +1,68 @@
+import time
+from datetime import datetime
+
+from django.core.cache import cache
+from django.utils.timezone import utc
+
+VERSION_PREFIX = 'cache-version'
+
+
+def namespace(name, pk=None):
+    """Пространство кэша, например feed или post:42."""
+    if pk is None:
+        return name
+    return f'{name}:{pk}'
+
+
+def version_key(space):
+    return f'{VERSION_PREFIX}:{space}'
+
+
+def initial_version():
+    # Версия из часов, а не 1: если ключ версии вытеснят, старые страницы
+    # с прежним номером всё равно не совпадут с новым.
+    return int(time.time() * 1000)
+
+
+def get_versions(spaces):
+    """Текущие версии пространств одним запросом к кэшу."""
+    keys = {version_key(space): space for space in spaces}
+    found = cache.get_many(list(keys))
+    versions = {}
+    for key, space in keys.items():
+        version = found.get(key)
+        if version is None:
+            version = initial_version()
+            if not cache.add(key, version, None):
+                version = cache.get(key, version)
+        versions[space] = version
+    return versions
+
+
+def versioned_key(prefix, spaces, versions=None):
+    """Ключ, который устаревает сам при смене версии любого пространства."""
+    if versions is None:
+        versions = get_versions(spaces)
+    stamp = '.'.join(f'{versions[space]}' for space in spaces)
+    return f'{prefix}:{stamp}'
+
+
+def modified_at(versions):
+    """Версия — это миллисекунды последнего bump, годится в Last-Modified."""
+    if not versions:
+        return None
+    return datetime.fromtimestamp(max(versions.values()) / 1000, tz=utc)
+
+
+def bump(*spaces):
+    """Сдвигает версии: всё, что закэшировано под ними, больше не читается.
+
+    Не incr: версию, которой ещё нет в кэше, incr не создаст, а все
+    пространства пишутся одним set_many. Гонка двух bump не страшна —
+    обе версии новые.
+    """
+    keys = [version_key(space) for space in set(spaces)]
+    found = cache.get_many(keys)
+    cache.set_many({
+        key: max(found.get(key, 0) + 1, initial_version()) for key in keys
+    }, None)
@@ -0,0 +1,50 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import AuthorStats, Follow, Post
+
+
+def author_counts(author_id):
+    return {
+        'posts_count': Post.objects.filter(author_id=author_id).count(),
+        'followers_count': Follow.objects.filter(author_id=author_id).count(),
+        'following_count': Follow.objects.filter(user_id=author_id).count(),
+    }
+
+
+def get_author_stats(author):
+    """Счётчики автора; отсутствующая строка собирается один раз."""
+    if author is None:
+        return None
+    stats = AuthorStats.objects.filter(pk=author.pk).first()
+    if stats is None:
+        stats, _ = AuthorStats.objects.get_or_create(
+            author_id=author.pk, defaults=author_counts(author.pk))
+    return stats
+
+
+def change_author_stats(author_id, **deltas):
+    """Сдвигает счётчики автора F-выражением одним UPDATE.
+
+    Недостающую строку создаём только при росте и сразу считаем по данным:
+    при удалениях автор может сам удаляться каскадом, а расхождения
+    чинит reconcile_counters.
+    """
+    if author_id is None:
+        return
+    updates = {name: F(name) + delta for name, delta in deltas.items()}
+    if AuthorStats.objects.filter(pk=author_id).update(**updates):
+        return
+    if min(deltas.values()) < 0:
+        return
+    try:
+        with transaction.atomic():
+            AuthorStats.objects.create(
+                author_id=author_id, **author_counts(author_id))
+    except IntegrityError:
+        pass
+
+
+def change_comments_count(post_id, delta):
+    Post.objects.filter(pk=post_id).update(
+        comments_count=F('comments_count') + delta)
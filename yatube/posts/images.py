@@ -0,0 +1,128 @@
+import logging
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation, ValidationError
+from django.core.files.uploadedfile import UploadedFile
+from PIL import Image, ImageOps
+from sorl.thumbnail import delete
+
+from .models import Post
+from .thumbnails import source_file
+
+logger = logging.getLogger(__name__)
+
+JPEG_QUALITY = 90
+# Форматы, которые Pillow только читает (XPM, PSD, SUN...), пишутся в PNG.
+FALLBACK_FORMAT = 'PNG'
+FALLBACK_CONTENT_TYPE = 'image/png'
+PNG_MODES = ('1', 'L', 'LA', 'I', 'P', 'RGB', 'RGBA')
+IMAGE_ERRORS = (OSError, KeyError, ValueError, Image.DecompressionBombError)
+
+
+def max_side():
+    return getattr(settings, 'POSTS_IMAGE_MAX_SIDE', 2048)
+
+
+def release_grace():
+    """Сколько секунд повторно взятый файл не удаляется."""
+    return getattr(settings, 'POSTS_IMAGE_RELEASE_GRACE', 60 * 5)
+
+
+def normalize_image(upload):
+    """Картинка поста не больше POSTS_IMAGE_MAX_SIDE и без метаданных.
+
+    JPEG декодируется сразу в уменьшенном масштабе через draft(), прочие
+    форматы уменьшаются через reduce() внутри thumbnail(). Поворот из
+    EXIF применяется уже к уменьшенной копии, сами EXIF и прочие
+    метаданные отбрасываются. Анимированные картинки остаются как есть.
+    Картинку, которую Pillow не смог разобрать или записать, форма
+    получает как ValidationError, а не как 500.
+    """
+    try:
+        return rewrite_image(upload)
+    except IMAGE_ERRORS:
+        logger.info('Не удалось обработать картинку %s', upload.name,
+                    exc_info=True)
+        raise ValidationError(
+            'Не удалось обработать картинку', code='invalid_image')
+
+
+def rewrite_image(upload):
+    upload.seek(0)
+    with Image.open(upload) as image:
+        if getattr(image, 'is_animated', False):
+            upload.seek(0)
+            return upload
+        format_ = image.format
+        scale = min(1, max_side() / max(image.size))
+        if format_ == 'JPEG':
+            image.draft('RGB', (
+                round(image.width * scale), round(image.height * scale)))
+        image.thumbnail((max_side(), max_side()), Image.LANCZOS,
+                        reducing_gap=3.0)
+        image.load()
+    image = ImageOps.exif_transpose(image)
+    name, content_type = upload.name, upload.content_type
+    Image.init()
+    if format_ not in Image.SAVE:
+        format_ = FALLBACK_FORMAT
+        name = os.path.splitext(name)[0] + '.png'
+        content_type = FALLBACK_CONTENT_TYPE
+        if image.mode not in PNG_MODES:
+            image = image.convert('RGBA')
+    # PNG и WebP сами дописывают EXIF из info, поэтому info очищается,
+    # а цветовой профиль и прозрачность передаются явно.
+    info, image.info = image.info, {}
+    params = {
+        key: info[key] for key in ('icc_profile', 'transparency')
+        if key in info
+    }
+    if format_ == 'JPEG':
+        params.update(quality=JPEG_QUALITY, optimize=True)
+    output = tempfile.SpooledTemporaryFile(
+        max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+    image.save(output, format_, **params)
+    size = output.tell()
+    output.seek(0)
+    return UploadedFile(output, name, content_type, size)
+
+
+def image_name(value):
+    """Имя файла из значения поля: строки из базы или FieldFile."""
+    return getattr(value, 'name', value) or ''
+
+
+def settle_image(name):
+    """Пост с картинкой закоммичен: отметка повторного использования
+    больше не держит файл, см. ContentAddressedStorage."""
+    try:
+        Post._meta.get_field('image').storage.settle(name)
+    except (SuspiciousFileOperation, OSError):
+        logger.warning('Не удалось снять отметку с картинки %s', name,
+                       exc_info=True)
+
+
+def release_image(name):
+    """Удаляет файл и его миниатюры, когда на него не ссылается ни один пост.
+
+    Одинаковые картинки хранятся одним файлом (ContentAddressedStorage),
+    так что ссылки считаются по таблице постов, а не по числу загрузок.
+    Ссылки проверяются под блокировкой файла, как и его повторное
+    использование в save(). Файл, взятый повторно в последние
+    POSTS_IMAGE_RELEASE_GRACE секунд, остаётся: пост с ним может быть
+    ещё не закоммичен. Уборка не должна ронять запрос: файл вне
+    MEDIA_ROOT или ошибка диска только пишутся в лог.
+    """
+    if not name:
+        return
+    storage = Post._meta.get_field('image').storage
+    try:
+        with storage.locked(name):
+            if (Post.objects.filter(image=name).exists()
+                    or storage.claimed_within(name, release_grace())):
+                return
+            delete(source_file(name))
+    except (SuspiciousFileOperation, OSError):
+        logger.warning('Не удалось удалить картинку %s', name, exc_info=True)
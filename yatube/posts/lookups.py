@@ -0,0 +1,76 @@
+import hashlib
+
+from django.core.cache import cache
+from django.http import Http404
+
+from .models import Group, User
+
+LOOKUP_TIMEOUT = 60 * 60 * 24
+MISSING_TIMEOUT = 60 * 5
+# Отрицательная запись: такого slug или username нет.
+MISSING = 'missing'
+
+AUTHOR_FIELDS = ('username', 'first_name', 'last_name')
+
+
+def lookup_key(kind, value):
+    """Ключ по хэшу: slug и username бывают не ASCII и длиной до 150
+    символов, а memcached таких ключей не принимает."""
+    digest = hashlib.md5(value.encode()).hexdigest()
+    return f'lookup:{kind}:{digest}'
+
+
+def group_lookup_key(slug):
+    return lookup_key('group', slug)
+
+
+def author_lookup_key(username):
+    return lookup_key('author', username)
+
+
+def cached_lookup(key, load):
+    """Объект из кэша; промах и отсутствие объекта тоже запоминаются.
+
+    Боты, перебирающие несуществующие адреса, упираются в отрицательную
+    запись с коротким сроком, а не в базу.
+    """
+    found = cache.get(key)
+    if found is None:
+        found = load()
+        if found is None:
+            cache.add(key, MISSING, MISSING_TIMEOUT)
+        else:
+            cache.set(key, found, LOOKUP_TIMEOUT)
+    if found == MISSING:
+        return None
+    return found
+
+
+def find_group(slug):
+    return cached_lookup(
+        group_lookup_key(slug),
+        lambda: Group.objects.filter(slug=slug).first(),
+    )
+
+
+def find_author(username):
+    """Автор без пароля и прочих полей: в кэш кладём только нужное."""
+    return cached_lookup(
+        author_lookup_key(username),
+        lambda: User.objects.only(*AUTHOR_FIELDS).filter(
+            username=username).first(),
+    )
+
+
+def get_group_or_404(slug):
+    group = find_group(slug)
+    if group is None:
+        raise Http404('Группа не найдена')
+    return group
+
+
+def get_author_or_404(username):
+    author = find_author(username)
+    if author is None:
+        raise Http404('Пользователь не найден')
+    return author
@@ -0,0 +1,112 @@
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from django.test.utils import override_settings
+
+from posts.models import Follow, Post, PullAuthor, TimelineEntry
+from posts.timelines import follow_feed
+from posts.utils import feed_queryset
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает раскладку постов по лентам (push) и гибридную ленту '
+        'на синтетическом графе подписок. Все данные откатываются, '
+        'кэш очищается.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--celebrities', type=int, default=5)
+        parser.add_argument('--follows', type=int, default=20,
+                            help='Среднее число подписок на обычных авторов')
+        parser.add_argument('--posts', type=int, default=200)
+        parser.add_argument('--reads', type=int, default=200)
+        parser.add_argument('--threshold', type=int, default=100)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        strategies = (
+            ('push', options['users'] + 1),
+            ('hybrid', options['threshold']),
+        )
+        for name, threshold in strategies:
+            result = self.run(options, threshold)
+            self.stdout.write(
+                f'{name:>6}: запись {result["write"]:.2f} мс/пост, '
+                f'чтение {result["read"]:.2f} мс/страница, '
+                f'строк ленты {result["rows"]}, '
+                f'авторов при чтении {result["pulled"]}'
+            )
+
+    def run(self, options, threshold):
+        rnd = random.Random(options['seed'])
+        cache.clear()
+        with override_settings(POSTS_FANOUT_THRESHOLD=threshold), \
+                transaction.atomic():
+            users = self.make_graph(rnd, options)
+            self.assign_modes(threshold)
+            authors = [user.pk for user in users]
+            weights = [
+                50 if i < options['celebrities'] else 1
+                for i in range(len(authors))
+            ]
+            started = time.perf_counter()
+            for author_id in rnd.choices(authors, weights,
+                                         k=options['posts']):
+                Post.objects.create(text='Пост', author_id=author_id)
+            write = time.perf_counter() - started
+
+            readers = rnd.sample(users, min(options['reads'], len(users)))
+            started = time.perf_counter()
+            for reader in readers:
+                posts, _ = follow_feed(reader)
+                list(feed_queryset(posts)[:10])
+            read = time.perf_counter() - started
+            result = {
+                'write': write * 1000 / max(options['posts'], 1),
+                'read': read * 1000 / max(len(readers), 1),
+                'rows': TimelineEntry.objects.count(),
+                'pulled': PullAuthor.objects.count(),
+            }
+            transaction.set_rollback(True)
+        cache.clear()
+        return result
+
+    def make_graph(self, rnd, options):
+        """Степенное распределение: знаменитости + случайные подписки."""
+        User.objects.bulk_create(
+            User(username=f'bench-{i}') for i in range(options['users'])
+        )
+        users = list(User.objects.filter(
+            username__startswith='bench-').order_by('pk'))
+        celebrities = users[:options['celebrities']]
+        follows = set()
+        for user in users:
+            for author in celebrities:
+                if author != user and rnd.random() < 0.8:
+                    follows.add((user.pk, author.pk))
+            count = min(int(rnd.paretovariate(1.5) * options['follows'] / 3),
+                        len(users) - 1)
+            for author in rnd.sample(users, count):
+                if author != user:
+                    follows.add((user.pk, author.pk))
+        Follow.objects.bulk_create(
+            (Follow(user_id=u, author_id=a) for u, a in follows),
+            batch_size=500,
+        )
+        return users
+
+    def assign_modes(self, threshold):
+        popular = Follow.objects.values('author_id').annotate(
+            followers=Count('pk')).filter(followers__gt=threshold)
+        PullAuthor.objects.bulk_create(
+            PullAuthor(author_id=row['author_id']) for row in popular
+        )
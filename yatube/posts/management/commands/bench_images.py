@@ -0,0 +1,85 @@
+import random
+import statistics
+import time
+from io import BytesIO
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from PIL import Image, ImageDraw, ImageOps
+from sorl.thumbnail.conf import settings as sorl_settings
+
+from posts.models import Post
+from posts.thumbnails import PICTURE_RATIO, PICTURE_WIDTHS, WEBP_SUPPORTED
+
+
+class Command(BaseCommand):
+    help = (
+        'Сжимает картинки постов во все ширины PICTURE_WIDTHS в JPEG и WebP '
+        'и печатает средний размер файла и время кодирования. Без картинок '
+        'в базе берёт синтетические.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--images', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        sources = self.load_sources(options['images'], options['seed'])
+        formats = ('JPEG', 'WEBP') if WEBP_SUPPORTED else ('JPEG',)
+        if not WEBP_SUPPORTED:
+            self.stdout.write('Pillow собран без WebP, замеряется только JPEG')
+        baseline = None
+        for width in sorted(PICTURE_WIDTHS, reverse=True):
+            size = (width, round(width * PICTURE_RATIO))
+            for format_ in formats:
+                sizes, timings = self.encode_all(sources, size, format_)
+                average = statistics.mean(sizes)
+                if baseline is None:
+                    baseline = average
+                self.stdout.write(
+                    f'{format_:>4} {width:>4}px: {average / 1024:7.1f} КБ '
+                    f'(экономия {1 - average / baseline:.0%} к JPEG '
+                    f'{max(PICTURE_WIDTHS)}px), '
+                    f'кодирование {statistics.median(timings):.2f} мс'
+                )
+
+    def load_sources(self, count, seed):
+        names = Post.objects.exclude(image='').order_by('-pk').values_list(
+            'image', flat=True)[:count]
+        sources = []
+        for name in names:
+            with default_storage.open(name) as image_file:
+                image = Image.open(image_file)
+                image.load()
+            sources.append(image.convert('RGB'))
+        return sources or self.synthetic(count, seed)
+
+    def synthetic(self, count, seed):
+        """Фото-подобные картинки: градиент и пятна, а не сплошной цвет."""
+        rnd = random.Random(seed)
+        images = []
+        for _ in range(count):
+            image = Image.linear_gradient('L').resize((1600, 1200)).convert(
+                'RGB')
+            draw = ImageDraw.Draw(image)
+            for _ in range(60):
+                x, y = rnd.randrange(1600), rnd.randrange(1200)
+                radius = rnd.randrange(20, 200)
+                draw.ellipse(
+                    (x - radius, y - radius, x + radius, y + radius),
+                    fill=tuple(rnd.randrange(256) for _ in range(3)),
+                )
+            images.append(image)
+        return images
+
+    def encode_all(self, sources, size, format_):
+        sizes, timings = [], []
+        for source in sources:
+            started = time.perf_counter()
+            frame = ImageOps.fit(source, size, Image.LANCZOS)
+            buffer = BytesIO()
+            frame.save(
+                buffer, format_, quality=sorl_settings.THUMBNAIL_QUALITY)
+            timings.append((time.perf_counter() - started) * 1000)
+            sizes.append(buffer.tell())
+        return sizes, timings
@@ -0,0 +1,253 @@
+import os
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from faker import Faker
+from PIL import Image
+
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+IMAGE_DIR = 'posts/generated'
+TEXT_POOL = 2000
+
+
+@contextmanager
+def manual_dates(*fields):
+    """Временно отключает auto_now_add, чтобы записать свои даты."""
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def next_pk(model):
+    return (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет базу синтетическими пользователями, группами, постами, '
+        'подписками и комментариями с реалистичными распределениями'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--groups', type=int, default=100)
+        parser.add_argument('--posts', type=int, default=200000)
+        parser.add_argument('--comments', type=int, default=200000)
+        parser.add_argument('--follows', type=int, default=20,
+                            help='Среднее число подписок пользователя')
+        parser.add_argument('--image-share', type=float, default=0.2,
+                            help='Доля постов с картинкой')
+        parser.add_argument('--days', type=int, default=365,
+                            help='За сколько дней раскидать публикации')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--timelines', action='store_true',
+                            help='Пересобрать ленты подписок после загрузки')
+
+    def handle(self, *args, **options):
+        self.rnd = random.Random(options['seed'])
+        self.faker = Faker('ru_RU')
+        self.faker.seed_instance(options['seed'])
+        self.batch_size = options['batch_size']
+        self.texts = [self.faker.paragraph(nb_sentences=4)
+                      for _ in range(TEXT_POOL)]
+        started = time.perf_counter()
+        total = 0
+
+        users = self.load('User', self.users(options))
+        authors = self.popularity(users)
+        groups = self.load('Group', self.groups(options))
+        with manual_dates(Post._meta.get_field('pub_date'),
+                          Comment._meta.get_field('created')):
+            posts = self.load('Post', self.posts(
+                options, authors, groups))
+            total += len(users) + len(groups) + len(posts)
+            total += self.load_count('Follow', self.follows(
+                options, users, authors))
+            total += self.load_count('Comment', self.comments(
+                options, users, posts))
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'Всего: {total} строк за {elapsed:.1f} с, '
+            f'{total / elapsed:.0f} строк/с'
+        )
+        self.stdout.write('Пересчёт денормализованных счётчиков')
+        call_command('reconcile_counters', stdout=self.stdout)
+        if options['timelines']:
+            call_command('rebuild_timelines', stdout=self.stdout)
+        cache.clear()
+
+    def load(self, name, rows):
+        """Пишет строки пачками и возвращает их первичные ключи."""
+        pks = []
+
+        def remember(batch):
+            pks.extend(obj.pk for obj in batch)
+            return batch
+        self.write(name, (remember(batch) for batch in rows))
+        return pks
+
+    def load_count(self, name, rows):
+        return self.write(name, rows)
+
+    def write(self, name, batches):
+        started = time.perf_counter()
+        written = 0
+        for batch in batches:
+            with transaction.atomic():
+                type(batch[0]).objects.bulk_create(batch)
+            written += len(batch)
+        elapsed = max(time.perf_counter() - started, 1e-9)
+        self.stdout.write(
+            f'{name}: {written} строк, {written / elapsed:.0f} строк/с'
+        )
+        return written
+
+    def chunks(self, objects):
+        batch = []
+        for obj in objects:
+            batch.append(obj)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def popularity(self, users):
+        """Веса авторов по закону Парето: немногие собирают почти всех."""
+        weights = [self.rnd.paretovariate(1.2) for _ in users]
+        cum_weights, acc = [], 0
+        for weight in weights:
+            acc += weight
+            cum_weights.append(acc)
+        return users, cum_weights
+
+    def users(self, options):
+        password = make_password(None)
+        start = next_pk(User)
+        now = timezone.now()
+        return self.chunks(
+            User(
+                pk=start + i,
+                username=f'{self.faker.user_name()}{start + i}',
+                first_name=self.faker.first_name(),
+                last_name=self.faker.last_name(),
+                password=password,
+                date_joined=now,
+            )
+            for i in range(options['users'])
+        )
+
+    def groups(self, options):
+        start = next_pk(Group)
+        return self.chunks(
+            Group(
+                pk=start + i,
+                title=self.faker.sentence(nb_words=3)[:200],
+                slug=f'group-{start + i}',
+                description=self.rnd.choice(self.texts),
+            )
+            for i in range(options['groups'])
+        )
+
+    def images(self, count=20):
+        """Несколько настоящих картинок, которые переиспользуют посты."""
+        folder = os.path.join(settings.MEDIA_ROOT, IMAGE_DIR)
+        os.makedirs(folder, exist_ok=True)
+        names = []
+        for i in range(count):
+            name = f'{IMAGE_DIR}/{i}.png'
+            path = os.path.join(settings.MEDIA_ROOT, name)
+            if not os.path.exists(path):
+                color = tuple(self.rnd.randrange(256) for _ in range(3))
+                Image.new('RGB', (1200, 800), color).save(path)
+            names.append(name)
+        return names
+
+    def bursts(self, options):
+        """Центры всплесков активности: посты кучкуются вокруг них."""
+        now = timezone.now()
+        count = max(options['posts'] // 50, 1)
+        return [
+            now - timedelta(seconds=self.rnd.uniform(
+                0, options['days'] * 86400))
+            for _ in range(count)
+        ]
+
+    def posts(self, options, authors, groups):
+        users, cum_weights = authors
+        images = self.images() if options['image_share'] > 0 else []
+        bursts = self.bursts(options)
+        now = timezone.now()
+        start = next_pk(Post)
+
+        def post(pk):
+            pub_date = self.rnd.choice(bursts) + timedelta(
+                minutes=self.rnd.expovariate(1 / 30))
+            has_image = images and self.rnd.random() < options['image_share']
+            post = Post(
+                pk=pk,
+                text=self.rnd.choice(self.texts),
+                pub_date=min(pub_date, now),
+                author_id=self.rnd.choices(users, cum_weights=cum_weights)[0],
+                group_id=(self.rnd.choice(groups)
+                          if groups and self.rnd.random() < 0.6 else None),
+                image=self.rnd.choice(images) if has_image else '',
+            )
+            # bulk_create не вызывает save(), HTML и анонс готовим сами.
+            post.render_text()
+            return post
+        return self.chunks(
+            post(start + i) for i in range(options['posts'])
+        )
+
+    def follows(self, options, users, authors):
+        authors, cum_weights = authors
+        pairs = (
+            (user_id, author_id)
+            for user_id in users
+            for author_id in set(self.rnd.choices(
+                authors, cum_weights=cum_weights,
+                k=min(int(self.rnd.paretovariate(1.5)
+                          * options['follows'] / 3), len(authors)),
+            ))
+            if author_id != user_id
+        )
+        return self.chunks(
+            Follow(user_id=user_id, author_id=author_id)
+            for user_id, author_id in pairs
+        )
+
+    def comments(self, options, users, posts):
+        if not posts:
+            return iter(())
+        now = timezone.now()
+        return self.chunks(
+            Comment(
+                # Большую часть комментариев собирают немногие посты.
+                post_id=posts[int(len(posts) * self.rnd.random() ** 3)],
+                author_id=self.rnd.choice(users),
+                text=self.rnd.choice(self.texts)[:200],
+                created=now,
+            )
+            for _ in range(options['comments'])
+        )
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import Follow, TimelineEntry
+from posts.timelines import rebuild_timeline
+
+
+class Command(BaseCommand):
+    help = 'Заново собирает ленты подписок из таблицы Follow'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'usernames', nargs='*',
+            help='Пересобрать только ленты этих пользователей'
+        )
+
+    def handle(self, *args, **options):
+        readers = Follow.objects.values_list('user_id', flat=True)
+        if options['usernames']:
+            readers = readers.filter(user__username__in=options['usernames'])
+        else:
+            TimelineEntry.objects.exclude(user_id__in=readers).delete()
+        total = 0
+        user_ids = sorted(set(readers))
+        for user_id in user_ids:
+            total += rebuild_timeline(user_id)
+        self.stdout.write(
+            f'Пересобрано лент: {len(user_ids)}, записей: {total}'
+        )
@@ -0,0 +1,82 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from posts.models import AuthorStats, Follow, Post
+
+User = get_user_model()
+
+
+def batches(queryset, size):
+    """Отдаёт списки первичных ключей пачками по size без OFFSET."""
+    last = None
+    while True:
+        page = queryset.order_by('pk')
+        if last is not None:
+            page = page.filter(pk__gt=last)
+        pks = list(page.values_list('pk', flat=True)[:size])
+        if not pks:
+            return
+        yield pks
+        last = pks[-1]
+
+
+def grouped_counts(queryset, field, pks):
+    rows = queryset.filter(**{f'{field}__in': pks}).values(field).annotate(
+        total=Count('pk')).order_by()
+    return {row[field]: row['total'] for row in rows}
+
+
+class Command(BaseCommand):
+    help = 'Сверяет денормализованные счётчики с данными и чинит расхождения'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        size = options['batch_size']
+        authors = sum(
+            self.reconcile_authors(pks) for pks in batches(User.objects, size)
+        )
+        posts = sum(
+            self.reconcile_posts(pks) for pks in batches(Post.objects, size)
+        )
+        self.stdout.write(
+            f'Исправлено счётчиков: авторов {authors}, постов {posts}'
+        )
+
+    @transaction.atomic
+    def reconcile_authors(self, pks):
+        posts = grouped_counts(Post.objects, 'author_id', pks)
+        followers = grouped_counts(Follow.objects, 'author_id', pks)
+        following = grouped_counts(Follow.objects, 'user_id', pks)
+        existing = AuthorStats.objects.select_for_update().in_bulk(pks)
+        fields = ('posts_count', 'followers_count', 'following_count')
+        missing, changed = [], []
+        for pk in pks:
+            truth = (posts.get(pk, 0), followers.get(pk, 0),
+                     following.get(pk, 0))
+            stats = existing.get(pk)
+            if stats is None:
+                missing.append(AuthorStats(author_id=pk, **dict(
+                    zip(fields, truth))))
+            elif tuple(getattr(stats, name) for name in fields) != truth:
+                for name, value in zip(fields, truth):
+                    setattr(stats, name, value)
+                changed.append(stats)
+        AuthorStats.objects.bulk_create(missing)
+        AuthorStats.objects.bulk_update(changed, fields)
+        return len(missing) + len(changed)
+
+    @transaction.atomic
+    def reconcile_posts(self, pks):
+        comments = Post.objects.filter(pk__in=pks).annotate(
+            total=Count('comments')).values_list(
+            'pk', 'comments_count', 'total')
+        changed = [
+            Post(pk=pk, comments_count=total)
+            for pk, stored, total in comments if stored != total
+        ]
+        Post.objects.bulk_update(changed, ('comments_count',))
+        return len(changed)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from posts.timelines import resume_fanout
+
+
+class Command(BaseCommand):
+    help = (
+        'Возвращает к раскладке по лентам авторов, у которых подписчиков '
+        'стало не больше POSTS_FANOUT_RESUME_THRESHOLD. Запускается '
+        'периодически, например из cron'
+    )
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Возвращено к раскладке авторов: {resume_fanout()}')
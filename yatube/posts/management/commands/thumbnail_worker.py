@@ -0,0 +1,64 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts.models import Post
+from posts.thumbnails import process_jobs, regenerate, setup_worker
+
+
+class Command(BaseCommand):
+    help = (
+        'Собирает миниатюры картинок из очереди, которую пополняют '
+        'post_create и post_edit. С --all пересобирает миниатюры всех '
+        'постов в пуле процессов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Разобрать очередь и выйти, а не ждать новых задач'
+        )
+        parser.add_argument('--interval', type=float, default=1.0)
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Пересобрать миниатюры всех картинок постов'
+        )
+        parser.add_argument(
+            '--processes', type=int, default=None,
+            help='Размер пула для --all; 0 — в этом процессе'
+        )
+
+    def handle(self, *args, **options):
+        if options['all']:
+            return self.regenerate_all(options['processes'])
+        total = 0
+        while True:
+            done = process_jobs(options['batch_size'])
+            total += done
+            if done:
+                continue
+            if options['once']:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write(f'Обработано задач: {total}')
+
+    def regenerate_all(self, processes):
+        names = sorted(set(
+            Post.objects.exclude(image='').values_list('image', flat=True)
+        ))
+        if processes == 0:
+            results = [regenerate(name) for name in names]
+        else:
+            # Открытые соединения не должны достаться дочерним процессам.
+            connections.close_all()
+            with ProcessPoolExecutor(
+                processes, initializer=setup_worker
+            ) as pool:
+                results = list(pool.map(regenerate, names, chunksize=16))
+        failed = results.count(False)
+        self.stdout.write(
+            f'Пересобрано картинок: {len(names) - failed}, ошибок: {failed}'
+        )
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from posts.timelines import trim_timelines
+
+
+class Command(BaseCommand):
+    help = (
+        'Обрезает ленты подписок до POSTS_TIMELINE_LENGTH последних постов. '
+        'Запускается периодически, например из cron'
+    )
+
+    def handle(self, *args, **options):
+        timelines, entries = trim_timelines()
+        self.stdout.write(
+            f'Обрезано лент: {timelines}, удалено записей: {entries}'
+        )
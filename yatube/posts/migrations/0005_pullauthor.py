@@ -0,0 +1,26 @@
+# Generated by Django 2.2.16 on 2026-10-17 07:17
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0011_update_proxy_permissions'),
+        ('posts', '0004_auto_20261017_0715'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PullAuthor',
+            fields=[
+                ('author', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='pull_feed', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+            ],
+            options={
+                'verbose_name': 'Автор с чтением при показе',
+                'verbose_name_plural': 'Авторы с чтением при показе',
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 2.2.16 on 2026-10-17 08:36
+
+from django.db import migrations, models
+from django.db.models.functions import Length
+
+
+def mark_truncated(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    Post.objects.annotate(length=Length('text')).filter(
+        length__gt=300).update(excerpt_truncated=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_image_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='excerpt_truncated',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Анонс обрезан'),
+        ),
+        migrations.RunPython(mark_truncated, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,14 @@
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.template.defaultfilters import linebreaksbr
+from django.utils.text import Truncator
+
+from core.storage import ContentAddressedStorage
 
 User = get_user_model()
 
+EXCERPT_LENGTH = 300
+
 
 class Group(models.Model):
     title = models.CharField(max_length=200)
@@ -23,6 +29,10 @@ class Post(models.Model):
         auto_now_add=True,
         db_index=True
     )
+    updated = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True
+    )
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -41,17 +51,63 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
-        blank=True
+        storage=ContentAddressedStorage(),
+        blank=True,
+        db_index=True
+    )
+    comments_count = models.IntegerField(
+        'Комментариев',
+        default=0,
+        editable=False
+    )
+    text_html = models.TextField(
+        'Текст в HTML',
+        blank=True,
+        editable=False
+    )
+    excerpt = models.CharField(
+        'Анонс',
+        max_length=EXCERPT_LENGTH,
+        blank=True,
+        editable=False
+    )
+    excerpt_truncated = models.BooleanField(
+        'Анонс обрезан',
+        default=False,
+        editable=False
     )
 
     class Meta:
         ordering = ('-pub_date',)
+        indexes = (
+            models.Index(fields=('-pub_date', '-id')),
+            models.Index(fields=('author', '-pub_date', '-id')),
+            models.Index(fields=('group', '-pub_date', '-id')),
+        )
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
 
     def __str__(self):
         return self.text[:15]
 
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'text' in update_fields:
+            self.render_text()
+            if update_fields is not None:
+                kwargs['update_fields'] = {
+                    *update_fields, 'text_html', 'excerpt',
+                    'excerpt_truncated'}
+        super().save(*args, **kwargs)
+
+    def render_text(self):
+        """Готовит HTML для страницы поста и анонс для карточек ленты."""
+        self.text_html = linebreaksbr(self.text, autoescape=True)
+        self.excerpt = Truncator(self.text).chars(EXCERPT_LENGTH)
+        # Не по «…» в конце анонса: таким многоточием может кончаться
+        # и короткий пост.
+        self.excerpt_truncated = len(self.text) > EXCERPT_LENGTH
+
 
 class Comment(models.Model):
     post = models.ForeignKey(
@@ -99,3 +155,79 @@ class Follow(models.Model):
 
     class Meta:
         unique_together = ['user', 'author']
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Подписчик',
+        related_name='timeline'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        verbose_name='Пост',
+        related_name='timeline_entries'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Автор',
+        related_name='+'
+    )
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        ordering = ('-pub_date', '-post')
+        unique_together = ['user', 'post']
+        indexes = (
+            models.Index(fields=('user', '-pub_date', '-post')),
+            models.Index(fields=('user', 'author')),
+        )
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи лент'
+
+
+class PullAuthor(models.Model):
+    """Автор, чьи посты не раскладываются по лентам, а читаются при показе."""
+    author = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        verbose_name='Автор',
+        related_name='pull_feed'
+    )
+
+    class Meta:
+        verbose_name = 'Автор с чтением при показе'
+        verbose_name_plural = 'Авторы с чтением при показе'
+
+
+class AuthorStats(models.Model):
+    """Счётчики пользователя, которые обновляются вместе с данными."""
+    author = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        verbose_name='Автор',
+        related_name='stats'
+    )
+    posts_count = models.IntegerField('Постов', default=0)
+    followers_count = models.IntegerField('Подписчиков', default=0)
+    following_count = models.IntegerField('Подписок', default=0)
+
+    class Meta:
+        verbose_name = 'Счётчики автора'
+        verbose_name_plural = 'Счётчики авторов'
+
+
+class ThumbnailJob(models.Model):
+    """Картинка, для которой воркер должен заранее собрать миниатюры."""
+    image = models.CharField('Файл', max_length=100, unique=True)
+    created = models.DateTimeField('Поставлена', auto_now_add=True)
+
+    class Meta:
+        ordering = ('pk',)
+        verbose_name = 'Задача на миниатюры'
+        verbose_name_plural = 'Задачи на миниатюры'
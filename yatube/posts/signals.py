@@ -0,0 +1,226 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import (post_delete, post_init, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+
+from core.versions import bump, namespace
+
+from .counters import change_author_stats, change_comments_count
+from .images import image_name, release_image, settle_image
+from .lookups import AUTHOR_FIELDS, author_lookup_key, group_lookup_key
+from .models import Comment, Follow, Group, Post, TimelineEntry, User
+from .timelines import (backfill_timeline, fan_out_post, purge_timeline,
+                        recent_posts_key, update_author_mode)
+from .utils import change_feed_count, feed_count_key, post_namespaces
+
+# group_id не загружен в post_init: пост пришёл из only()/defer().
+UNLOADED = object()
+
+
+def post_feed_keys(post, group_id):
+    keys = [feed_count_key('all')]
+    if group_id is not None:
+        keys.append(feed_count_key('group', group_id))
+    if post.author_id is not None:
+        keys.append(feed_count_key('author', post.author_id))
+    return keys
+
+
+def comment_namespaces(comment):
+    """Комментарий меняет счётчик на карточке поста во всех лентах."""
+    try:
+        return post_namespaces(comment.post)
+    except Post.DoesNotExist:
+        return [namespace('post', comment.post_id)]
+
+
+def loaded_image_name(post):
+    """Имя картинки или None, если поле не загружено (only/defer)."""
+    if 'image' not in post.__dict__:
+        return None
+    return image_name(post.__dict__['image'])
+
+
+def release_image_on_commit(name):
+    if name:
+        transaction.on_commit(lambda: release_image(name))
+
+
+def settle_image_on_commit(name):
+    if name:
+        transaction.on_commit(lambda: settle_image(name))
+
+
+def remembered_group_id(post):
+    """Группа поста до изменений.
+
+    post_init не трогает отложенный group_id (only/defer), иначе каждая
+    такая строка стоила бы отдельного SELECT. Догружаем его, только когда
+    пост правда сохраняют или удаляют.
+    """
+    if post._feed_group_id is UNLOADED:
+        post._feed_group_id = post.group_id
+    return post._feed_group_id
+
+
+@receiver(post_init, sender=Post)
+def remember_post_group(sender, instance, **kwargs):
+    instance._feed_group_id = instance.__dict__.get('group_id', UNLOADED)
+    instance._image_name = loaded_image_name(instance)
+
+
+@receiver(post_save, sender=Post)
+def release_replaced_image(sender, instance, **kwargs):
+    """Заменённая или убранная картинка освобождается после коммита.
+
+    С новой картинки после коммита снимается отметка повторного
+    использования: ссылка на неё теперь видна release_image.
+    """
+    name = loaded_image_name(instance)
+    if name is None:
+        return
+    if instance._image_name != name:
+        settle_image_on_commit(name)
+        release_image_on_commit(instance._image_name)
+    instance._image_name = name
+
+
+@receiver(post_save, sender=Post)
+def count_saved_post(sender, instance, created, **kwargs):
+    if created:
+        for key in post_feed_keys(instance, instance.group_id):
+            change_feed_count(key, 1)
+        change_author_stats(instance.author_id, posts_count=1)
+        fan_out_post(instance)
+    elif remembered_group_id(instance) != instance.group_id:
+        if instance._feed_group_id is not None:
+            change_feed_count(
+                feed_count_key('group', instance._feed_group_id), -1)
+        if instance.group_id is not None:
+            change_feed_count(feed_count_key('group', instance.group_id), 1)
+    bump(*post_namespaces(instance, instance._feed_group_id))
+    instance._feed_group_id = instance.group_id
+
+
+@receiver(pre_delete, sender=Post)
+def remember_post_readers(sender, instance, **kwargs):
+    # После удаления строки догрузить группу уже не выйдет.
+    remembered_group_id(instance)
+    instance._timeline_users = list(TimelineEntry.objects.filter(
+        post_id=instance.pk).values_list('user_id', flat=True))
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    keys = post_feed_keys(instance, instance._feed_group_id)
+    keys.extend(
+        feed_count_key('follower', user_id)
+        for user_id in getattr(instance, '_timeline_users', ())
+    )
+    for key in keys:
+        change_feed_count(key, -1)
+    change_author_stats(instance.author_id, posts_count=-1)
+    cache.delete(recent_posts_key(instance.author_id))
+    bump(*post_namespaces(instance, instance._feed_group_id))
+
+
+@receiver(post_delete, sender=Post)
+def release_deleted_image(sender, instance, **kwargs):
+    release_image_on_commit(
+        loaded_image_name(instance) or instance._image_name)
+
+
+def group_namespaces(group):
+    # groups — названия групп на карточках профилей и постов.
+    return namespace('feed'), namespace('groups'), namespace('group', group.pk)
+
+
+@receiver(post_init, sender=Group)
+def remember_group_slug(sender, instance, **kwargs):
+    # Через __dict__, чтобы не подгружать отложенное поле.
+    instance._lookup_slug = instance.__dict__.get('slug')
+
+
+@receiver(post_save, sender=Group)
+def refresh_group(sender, instance, **kwargs):
+    cache.delete_many([group_lookup_key(slug) for slug in {
+        instance._lookup_slug, instance.slug} - {None}])
+    instance._lookup_slug = instance.slug
+    bump(*group_namespaces(instance))
+
+
+@receiver(post_delete, sender=Group)
+def forget_group_count(sender, instance, **kwargs):
+    cache.delete(feed_count_key('group', instance.pk))
+    cache.delete(group_lookup_key(instance.slug))
+    bump(*group_namespaces(instance))
+
+
+def author_card(user):
+    """Поля автора, которые видны на карточках чужих лент."""
+    return {
+        field: user.__dict__[field]
+        for field in AUTHOR_FIELDS if field in user.__dict__
+    }
+
+
+@receiver(post_init, sender=User)
+def remember_username(sender, instance, **kwargs):
+    instance._lookup_username = instance.__dict__.get('username')
+    instance._author_card = author_card(instance)
+
+
+@receiver(post_save, sender=User)
+def refresh_author(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    cache.delete_many([author_lookup_key(username) for username in {
+        instance._lookup_username, instance.username} - {None}])
+    instance._lookup_username = instance.username
+    spaces = [namespace('author', instance.pk)]
+    card = author_card(instance)
+    if card != instance._author_card:
+        # Имя автора есть на главной, в группах и в комментариях.
+        spaces.append(namespace('authors'))
+        instance._author_card = card
+    bump(*spaces)
+
+
+@receiver(post_delete, sender=User)
+def forget_author(sender, instance, **kwargs):
+    cache.delete(author_lookup_key(instance.username))
+    bump(namespace('author', instance.pk), namespace('authors'))
+
+
+@receiver(post_save, sender=Follow)
+def fill_timeline(sender, instance, created, **kwargs):
+    if created:
+        change_author_stats(instance.author_id, followers_count=1)
+        change_author_stats(instance.user_id, following_count=1)
+        backfill_timeline(instance.user_id, instance.author_id)
+        update_author_mode(instance.author_id)
+        bump(namespace('author', instance.author_id),
+             namespace('author', instance.user_id))
+
+
+@receiver(post_delete, sender=Follow)
+def clear_timeline(sender, instance, **kwargs):
+    change_author_stats(instance.author_id, followers_count=-1)
+    change_author_stats(instance.user_id, following_count=-1)
+    purge_timeline(instance.user_id, instance.author_id)
+    bump(namespace('author', instance.author_id),
+         namespace('author', instance.user_id))
+
+
+@receiver(post_save, sender=Comment)
+def count_comment(sender, instance, created, **kwargs):
+    if created:
+        change_comments_count(instance.post_id, 1)
+    bump(*comment_namespaces(instance))
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    change_comments_count(instance.post_id, -1)
+    bump(*comment_namespaces(instance))
@@ -0,0 +1,81 @@
+import hashlib
+
+from django import template
+from django.core.cache import cache
+from django.template.loader import get_template
+from django.utils.safestring import mark_safe
+from django.utils.translation import get_language
+
+from ..thumbnails import DETAIL_SIZES, resolve_thumbnails
+
+register = template.Library()
+
+CARD_TIMEOUT = 60 * 60 * 24
+CARD_TEMPLATE = 'posts/includes/cards/{}.html'
+
+
+def card_version(post):
+    """Всё, что видно на карточке, но может смениться без post.updated.
+
+    Счётчик комментариев двигается через F(), а имя автора и название
+    группы лежат в других таблицах, поэтому они входят в версию явно.
+    """
+    group = post.group
+    parts = (
+        post.updated.isoformat() if post.updated else '',
+        post.comments_count,
+        post.author.get_full_name() if post.author else '',
+        post.author.username if post.author else '',
+        group.title if group else '',
+        group.slug if group else '',
+        get_language(),
+    )
+    raw = '|'.join(str(part) for part in parts)
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def card_key(post, variant):
+    return f'post-card:{variant}:{post.pk}:{card_version(post)}'
+
+
+@register.simple_tag
+def post_cards(posts, variant='feed'):
+    """Готовый HTML карточек страницы: один get_many на все посты.
+
+    Отрисовываются только промахи, и они сразу ложатся в кэш, так что
+    ленты разных пользователей делят одни и те же карточки. Миниатюры
+    промахов находятся разом, через resolve_thumbnails. Карточка с
+    оригиналом вместо ещё не собранных миниатюр в кэш не кладётся.
+    """
+    posts = list(posts)
+    keys = [card_key(post, variant) for post in posts]
+    cards = cache.get_many(keys)
+    misses = [
+        (key, post) for key, post in zip(keys, posts) if key not in cards
+    ]
+    pictures = resolve_thumbnails(post.image for _, post in misses)
+    missing = {}
+    pending = set()
+    if misses:
+        card_template = get_template(CARD_TEMPLATE.format(variant))
+    for key, post in misses:
+        picture = pictures.get(post.image.name)
+        missing[key] = card_template.render({
+            'post': post,
+            'picture': picture,
+        })
+        if picture is not None and picture.pending:
+            pending.add(key)
+    ready = {
+        key: html for key, html in missing.items() if key not in pending
+    }
+    if ready:
+        cache.set_many(ready, CARD_TIMEOUT)
+    cards.update(missing)
+    return [mark_safe(cards[key]) for key in keys]
+
+
+@register.simple_tag
+def post_picture(image):
+    """Варианты картинки для страницы поста или None, если её нет."""
+    return resolve_thumbnails([image], DETAIL_SIZES).get(image.name)
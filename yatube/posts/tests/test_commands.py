@@ -0,0 +1,149 @@
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from sorl.thumbnail import default
+
+from ..models import (AuthorStats, Comment, Follow, Group, Post,
+                      ThumbnailJob, User)
+from ..templatetags.post_cards import card_key
+from ..thumbnails import PICTURE_WIDTHS, THUMBNAIL_GEOMETRIES
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class GenerateDataTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def generate(self):
+        call_command(
+            'generate_data', seed=7, users=30, groups=3, posts=200,
+            comments=50, follows=5, batch_size=40, stdout=StringIO(),
+        )
+
+    def test_generate_data_fills_tables(self):
+        """Команда заполняет все таблицы и пересчитывает счётчики."""
+        self.generate()
+        self.assertEqual(User.objects.count(), 30)
+        self.assertEqual(Group.objects.count(), 3)
+        self.assertEqual(Post.objects.count(), 200)
+        self.assertEqual(Comment.objects.count(), 50)
+        self.assertTrue(Follow.objects.exists())
+        self.assertTrue(Post.objects.exclude(image='').exists())
+        stats = AuthorStats.objects.get(author=Post.objects.first().author)
+        self.assertEqual(
+            stats.posts_count,
+            Post.objects.filter(author=stats.author).count()
+        )
+
+    def test_generate_data_is_reproducible(self):
+        """С одинаковым seed получаются одинаковые данные."""
+        self.generate()
+        first = list(Post.objects.order_by('pk').values_list('text', 'image'))
+        Post.objects.all().delete()
+        User.objects.all().delete()
+        Group.objects.all().delete()
+        self.generate()
+        second = list(Post.objects.order_by('pk').values_list('text', 'image'))
+        self.assertEqual(first, second)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailWorkerTests(TestCase):
+    GIF = (
+        b'\x47\x49\x46\x38\x39\x61\x02\x00'
+        b'\x01\x00\x80\x00\x00\x00\x00\x00'
+        b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+        b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+        b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+        b'\x0A\x00\x3B'
+    )
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.client.force_login(self.author)
+
+    def create_post(self):
+        self.client.post(reverse('posts:post_create'), {
+            'text': 'Пост с картинкой',
+            'image': SimpleUploadedFile(
+                'small.gif', self.GIF, content_type='image/gif'),
+        })
+        return Post.objects.get()
+
+    def test_pages_render_pregenerated_thumbnails(self):
+        """Миниатюры собирает воркер, а не первый показ страницы."""
+        post = self.create_post()
+        self.assertTrue(
+            ThumbnailJob.objects.filter(image=post.image.name).exists())
+        out = StringIO()
+        call_command('thumbnail_worker', once=True, stdout=out)
+        self.assertIn('Обработано задач: 1', out.getvalue())
+        self.assertFalse(ThumbnailJob.objects.exists())
+        with mock.patch.object(
+            default.backend, '_create_thumbnail'
+        ) as create:
+            self.client.get(reverse('posts:index'))
+            self.client.get(
+                reverse('posts:post_detail', kwargs={'post_id': post.pk}))
+        create.assert_not_called()
+
+    def test_pages_do_not_build_thumbnails(self):
+        """До воркера страница показывает оригинал и не кэширует карточку."""
+        post = self.create_post()
+        ThumbnailJob.objects.all().delete()
+        with mock.patch.object(
+            default.backend, '_create_thumbnail'
+        ) as create:
+            response = self.client.get(reverse('posts:index'))
+        create.assert_not_called()
+        self.assertContains(response, f'src="{post.image.url}"')
+        self.assertNotContains(response, ' 960w')
+        self.assertIsNone(cache.get(card_key(post, 'feed')))
+        self.assertTrue(
+            ThumbnailJob.objects.filter(image=post.image.name).exists())
+        call_command('thumbnail_worker', once=True, stdout=StringIO())
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, ' 960w')
+        self.assertIsNotNone(cache.get(card_key(post, 'feed')))
+
+    def test_edit_without_new_image_is_not_queued(self):
+        post = self.create_post()
+        ThumbnailJob.objects.all().delete()
+        self.client.post(
+            reverse('posts:post_edit', kwargs={'post_id': post.pk}),
+            {'text': 'Новый текст'},
+        )
+        self.assertFalse(ThumbnailJob.objects.exists())
+
+    def test_regenerate_all(self):
+        self.create_post()
+        out = StringIO()
+        with mock.patch.object(
+            default.backend, '_create_thumbnail',
+            wraps=default.backend._create_thumbnail,
+        ) as create:
+            call_command(
+                'thumbnail_worker', all=True, processes=0, stdout=out)
+        self.assertEqual(create.call_count, len(THUMBNAIL_GEOMETRIES))
+        self.assertIn('Пересобрано картинок: 1, ошибок: 0', out.getvalue())
+
+
+class BenchImagesTests(TestCase):
+    def test_reports_every_width(self):
+        out = StringIO()
+        call_command('bench_images', images=1, stdout=out)
+        for width in PICTURE_WIDTHS:
+            self.assertIn(f'JPEG {width:>4}px', out.getvalue())
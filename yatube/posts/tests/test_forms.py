@@ -1,11 +1,18 @@
+import os
 import shutil
+import struct
 import tempfile
+import time
+import zlib
 from http import HTTPStatus
+from io import BytesIO
+from unittest import skipUnless
 
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.conf import settings
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from PIL import Image
 
 from ..models import Group, Post, User, Comment
 
@@ -73,11 +80,11 @@ class PostFormsTest(TestCase):
             (post.author, self.post.author),
             (post.text, self.post.text),
             (post.group, self.post.group),
-            (post.image, f'posts/{self.uploaded}'),
         )
         for new_post, expected in check_post_fields:
             with self.subTest(new_post=expected):
                 self.assertEqual(new_post, expected)
+        self.assertRegex(post.image.name, r'^posts/[0-9a-f]{2}/[0-9a-f]{64}$')
 
     def test_edit_post(self):
         posts_count = Post.objects.count()
@@ -117,3 +124,118 @@ class PostFormsTest(TestCase):
             Comment.objects.filter(text='Новый комментарий').exists()
         )
         self.assertEqual(Comment.objects.count(), comments_count + 1)
+
+
+def png_header(width, height):
+    """PNG с такими размерами в заголовке и почти без данных."""
+    def chunk(kind, data):
+        crc = zlib.crc32(kind + data)
+        return struct.pack('>I', len(data)) + kind + data + struct.pack(
+            '>I', crc)
+    header = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return (
+        b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header)
+        + chunk(b'IDAT', zlib.compress(b'\x00' * 64)) + chunk(b'IEND', b'')
+    )
+
+
+XPM = b"""/* XPM */
+static char *icon[] = {
+"2 1 2 1",
+"a c #FF0000",
+"b c None",
+"ab"
+};
+"""
+
+
+def memory_kb(field):
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith(field):
+                return int(line.split()[1])
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ImageUploadTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='uploader')
+        photo = Image.linear_gradient('L').resize((6000, 4000)).convert('RGB')
+        buffer = BytesIO()
+        photo.save(buffer, 'JPEG', quality=85)
+        cls.large_jpeg = buffer.getvalue()
+
+    def setUp(self):
+        self.client.force_login(self.author)
+
+    def upload(self, content, name='image.jpg'):
+        return self.client.post(reverse('posts:post_create'), {
+            'text': 'Пост с картинкой',
+            'image': SimpleUploadedFile(name, content, 'image/jpeg'),
+        })
+
+    @override_settings(UPLOAD_MAX_FILE_SIZE=100 * 1024)
+    def test_upload_over_byte_limit_is_rejected(self):
+        response = self.upload(os.urandom(300 * 1024))
+        self.assertFormError(
+            response, 'form', 'image', 'Файл больше 100,0\xa0КБ')
+        self.assertFalse(Post.objects.exists())
+
+    def test_decompression_bomb_is_rejected_by_header(self):
+        """Картинку 12000x12000 не декодируют: отказ по заголовку."""
+        started = time.perf_counter()
+        response = self.upload(png_header(12000, 12000), 'bomb.png')
+        self.assertLess(time.perf_counter() - started, 1)
+        self.assertFormError(
+            response, 'form', 'image', 'Картинка больше 40 мегапикселей')
+        self.assertFalse(Post.objects.exists())
+
+    @skipUnless(os.path.exists('/proc/self/clear_refs'), 'нужен Linux')
+    def test_large_jpeg_is_downscaled_cheaply(self):
+        """24 Мп JPEG декодируется в половинном масштабе через draft().
+
+        С полным декодированием пик памяти здесь около 115 МБ и 0,8 с,
+        через draft() — около 50 МБ и 0,3 с.
+        """
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+        before = memory_kb('VmRSS')
+        started = time.perf_counter()
+        self.upload(self.large_jpeg)
+        elapsed = time.perf_counter() - started
+        peak_mb = (memory_kb('VmHWM') - before) / 1024
+        self.assertLess(peak_mb, 64)
+        self.assertLess(elapsed, 3)
+        post = Post.objects.get()
+        self.assertEqual(
+            (post.image.width, post.image.height), (2048, 1365))
+
+    def test_read_only_format_is_stored_as_png(self):
+        """XPM Pillow не пишет: картинка сохраняется в PNG, а не 500."""
+        response = self.upload(XPM, 'icon.xpm')
+        self.assertEqual(response.status_code, 302)
+        post = Post.objects.get()
+        self.assertTrue(post.image.name.endswith('.png'))
+        with Image.open(post.image) as stored:
+            self.assertEqual(stored.format, 'PNG')
+            self.assertEqual(stored.size, (2, 1))
+
+    def test_truncated_image_is_rejected(self):
+        response = self.upload(self.large_jpeg[:4096])
+        self.assertFormError(
+            response, 'form', 'image', 'Не удалось обработать картинку')
+        self.assertFalse(Post.objects.exists())
+
+    def test_metadata_is_stripped_and_orientation_applied(self):
+        exif = Image.Exif()
+        exif[0x010E] = 'Координаты дома'
+        exif[0x0112] = 6
+        buffer = BytesIO()
+        Image.new('RGB', (40, 20), 'red').save(buffer, 'JPEG', exif=exif)
+        self.upload(buffer.getvalue())
+        with Image.open(Post.objects.get().image) as stored:
+            self.assertEqual(stored.size, (20, 40))
+            self.assertFalse(stored.getexif())
+            self.assertNotIn('exif', stored.info)
@@ -1,8 +1,15 @@
-from django.test import TestCase
+import shutil
+import tempfile
 
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, TransactionTestCase, override_settings
 
 from ..models import Post, Group, User
 
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
 
 class PostModelTest(TestCase):
     @classmethod
@@ -53,3 +60,65 @@ class PostModelTest(TestCase):
                     Post._meta.get_field(field).help_text,
                     expected
                 )
+
+    def test_text_is_rendered_on_save(self):
+        """HTML и анонс готовятся при сохранении, а не на каждом показе."""
+        post = Post(author=self.user, text='<b>' + 'слово ' * 100 + '\nконец')
+        post.save()
+        self.assertTrue(post.text_html.startswith('&lt;b&gt;'))
+        self.assertIn('<br>конец', post.text_html)
+        self.assertEqual(len(post.excerpt), 300)
+        self.assertTrue(post.excerpt_truncated)
+        post.text = 'Коротко'
+        post.save(update_fields=['text'])
+        post.refresh_from_db()
+        self.assertEqual((post.text_html, post.excerpt), ('Коротко',) * 2)
+        self.assertFalse(post.excerpt_truncated)
+
+    def test_short_post_ending_with_ellipsis_is_not_truncated(self):
+        post = Post.objects.create(author=self.user, text='Продолжение…')
+        self.assertEqual(post.excerpt, 'Продолжение…')
+        self.assertFalse(post.excerpt_truncated)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ImageReferenceTests(TransactionTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='auth')
+
+    def create_post(self, content=b'GIF89a-first'):
+        return Post.objects.create(
+            author=self.user, text='Пост',
+            image=SimpleUploadedFile('image.gif', content),
+        )
+
+    def test_shared_file_lives_until_last_post(self):
+        first, second = self.create_post(), self.create_post()
+        self.assertEqual(first.image.name, second.image.name)
+        storage = first.image.storage
+        first.delete()
+        self.assertTrue(storage.exists(second.image.name))
+        second.delete()
+        self.assertFalse(storage.exists(second.image.name))
+
+    def test_file_reused_by_uncommitted_post_is_kept(self):
+        """Ссылку из чужой незакоммиченной транзакции не видно: файл,
+        только что взятый повторно, release_image не удаляет."""
+        post = self.create_post(b'GIF89a-pending')
+        storage = post.image.storage
+        storage.save('posts/image.gif', ContentFile(b'GIF89a-pending'))
+        post.delete()
+        self.assertTrue(storage.exists(post.image.name))
+
+    def test_replaced_image_is_released(self):
+        post = self.create_post()
+        old_name = post.image.name
+        post.image = SimpleUploadedFile('image.gif', b'GIF89a-second')
+        post.save()
+        self.assertFalse(post.image.storage.exists(old_name))
+        self.assertTrue(post.image.storage.exists(post.image.name))
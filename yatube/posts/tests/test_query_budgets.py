@@ -0,0 +1,168 @@
+import re
+import shutil
+import tempfile
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .. import thumbnails
+from ..models import Comment, Follow, Group, Post, User
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+# Бюджеты запросов: имя url, kwargs, клиент, метод, запросов, мс SQL.
+# Клиенты: guest — аноним, reader — подписчик, author — автор постов.
+# Миниатюры заранее нарезаны, как воркером. Перед замером страница
+# открывается один раз, а кэш очищается, так что считается холодный
+# путь рендера.
+BUDGETS = (
+    ('posts:index', {}, 'guest', 'get', 2, 100),
+    ('posts:index', {}, 'reader', 'get', 4, 100),
+    ('posts:group_list', {'slug': 'group-0'}, 'guest', 'get', 3, 100),
+    ('posts:profile', {'username': 'author'}, 'guest', 'get', 4, 100),
+    ('posts:profile', {'username': 'author'}, 'reader', 'get', 7, 100),
+    ('posts:post_detail', {'post_id': 'post'}, 'guest', 'get', 4, 100),
+    ('posts:post_detail', {'post_id': 'post'}, 'reader', 'get', 6, 100),
+    ('posts:post_edit', {'post_id': 'post'}, 'author', 'get', 5, 100),
+    ('posts:post_create', {}, 'author', 'get', 3, 100),
+    ('posts:post_create', {}, 'author', 'post', 7, 250),
+    ('posts:add_comment', {'post_id': 'post'}, 'reader', 'post', 5, 250),
+    ('posts:follow_index', {}, 'reader', 'get', 5, 100),
+    ('posts:profile_follow', {'username': 'other'}, 'reader', 'get', 16, 250),
+    ('posts:profile_unfollow', {'username': 'author'}, 'reader', 'get',
+     8, 250),
+    ('users:signup', {}, 'guest', 'get', 0, 100),
+    ('users:login', {}, 'guest', 'get', 0, 100),
+    ('users:logout', {}, 'reader', 'get', 4, 100),
+    ('users:password_change', {}, 'reader', 'get', 2, 100),
+    ('users:password_change_done', {}, 'reader', 'get', 2, 100),
+    ('users:password_reset_form', {}, 'guest', 'get', 0, 100),
+    ('users:password_reset_done', {}, 'guest', 'get', 0, 100),
+    ('about:author', {}, 'guest', 'get', 0, 100),
+    ('about:tech', {}, 'guest', 'get', 0, 100),
+)
+
+# GET-адреса, которые меняют состояние: их нельзя прогревать повтором.
+ACTIONS = ('posts:profile_follow', 'posts:profile_unfollow', 'users:logout')
+
+POST_DATA = {
+    'posts:post_create': {'text': 'Новый пост'},
+    'posts:add_comment': {'text': 'Новый комментарий'},
+}
+
+
+def normalize(sql):
+    """Приводит SQL к шаблону, чтобы одинаковые запросы склеивались."""
+    sql = re.sub(r'"s\d+_x\d+"', '"s?"', sql)
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r'\b\d+(\.\d+)?\b', '?', sql)
+    return re.sub(r'\(\?(, \?)+\)', '(?, ...)', sql)
+
+
+def report(queries, limit, budget_ms, spent_ms):
+    """Описание превышения: повторы запросов сверху, они и есть N+1."""
+    counts = Counter(normalize(query['sql']) for query in queries)
+    lines = [
+        f'запросов {len(queries)} при бюджете {limit} '
+        f'({len(queries) - limit:+d}), SQL {spent_ms:.1f} мс '
+        f'при бюджете {budget_ms} мс'
+    ]
+    for sql, count in counts.most_common():
+        marker = '+' if count > 1 else ' '
+        lines.append(f'{marker} {count:>3} x {sql}')
+    return '\n'.join(lines)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class QueryBudgetTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(
+            username='author', first_name='Лев', last_name='Толстой')
+        cls.reader = User.objects.create_user(username='reader')
+        other = User.objects.create_user(username='other')
+        readers = [
+            User.objects.create_user(username=f'reader-{i}')
+            for i in range(20)
+        ]
+        groups = [
+            Group.objects.create(title=f'Группа {i}', slug=f'group-{i}',
+                                 description='Описание')
+            for i in range(5)
+        ]
+        for follower in [cls.reader, *readers]:
+            Follow.objects.create(user=follower, author=cls.author)
+        for i in range(30):
+            post = Post.objects.create(
+                author=cls.author,
+                text=f'Пост {i}',
+                group=groups[i % len(groups)],
+                image=SimpleUploadedFile(
+                    f'{i}.gif', GIF, content_type='image/gif'
+                ) if i % 3 == 0 else None,
+            )
+            if post.image:
+                thumbnails.generate(post.image.name)
+            Comment.objects.bulk_create(
+                Comment(post=post, author=reader, text='Комментарий')
+                for reader in readers[:i % 7])
+        cls.post = post
+        # У other есть посты: подписка на него дозаполняет ленту.
+        for i in range(10):
+            Post.objects.create(author=other, text=f'Пост other {i}')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def client_for(self, name):
+        client = Client()
+        if name != 'guest':
+            client.force_login(getattr(self, name))
+        return client
+
+    def url_for(self, name, kwargs):
+        kwargs = {
+            key: self.post.pk if value == 'post' else value
+            for key, value in kwargs.items()
+        }
+        return reverse(name, kwargs=kwargs)
+
+    def test_views_fit_query_budgets(self):
+        """Каждая страница укладывается в бюджет запросов и времени SQL."""
+        for name, kwargs, who, method, limit, budget_ms in BUDGETS:
+            with self.subTest(url=name, client=who, method=method):
+                client = self.client_for(who)
+                url = self.url_for(name, kwargs)
+                if method == 'get' and name not in ACTIONS:
+                    client.get(url)
+                cache.clear()
+                with CaptureQueriesContext(connection) as queries:
+                    if method == 'post':
+                        response = client.post(url, POST_DATA.get(name, {}))
+                    else:
+                        response = client.get(url)
+                self.assertLess(response.status_code, 400)
+                spent_ms = sum(
+                    float(query['time']) for query in queries) * 1000
+                self.assertTrue(
+                    len(queries) <= limit and spent_ms <= budget_ms,
+                    report(queries, limit, budget_ms, spent_ms),
+                )
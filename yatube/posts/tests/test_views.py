@@ -4,10 +4,21 @@ from django import forms
 from django.conf import settings
 import tempfile
 import shutil
+from io import StringIO
+from unittest import mock, skipUnless
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from sorl.thumbnail import default, get_thumbnail
 
-from ..models import Post, Group, User, Follow
+from core.versions import get_versions, namespace
+from .. import thumbnails
+from ..models import (AuthorStats, Comment, Follow, Group, Post, PullAuthor,
+                      TimelineEntry, User)
+from ..lookups import author_lookup_key, group_lookup_key
+from ..utils import estimate_marker_key, feed_count_key
 
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
@@ -157,12 +168,176 @@ class PostPagesTests(TestCase):
         response = self.authorized_client.get(reverse('posts:index'))
         response_post = response.context['page_obj'][0]
         self.assertEqual(post, response_post)
-        post.delete()
+        Post.objects.filter(pk=post.pk).update(text='без сигнала')
         response_2 = self.authorized_client.get(reverse('posts:index'))
         self.assertEqual(response.content, response_2.content)
-        cache.clear()
+        post.delete()
         response_3 = self.authorized_client.get(reverse('posts:index'))
         self.assertNotEqual(response.content, response_3.content)
+        self.assertNotContains(response_3, 'без сигнала')
+
+    def test_cache_versions_follow_changes(self):
+        """Комментарий, группа и подписка сразу сбрасывают свои страницы."""
+        group_url = reverse('posts:group_list', kwargs={'slug': 'test-slug'})
+        self.authorized_client.get(group_url)
+        self.group.title = 'Новое название'
+        self.group.save()
+        self.assertContains(
+            self.authorized_client.get(group_url), 'Новое название')
+        self.authorized_client.get(reverse('posts:index'))
+        Comment.objects.create(post=self.post, author=self.user, text='к')
+        response = self.authorized_client.get(reverse('posts:index'))
+        self.assertEqual(response.context['page_obj'][0].comments_count, 1)
+        self.assertEqual(response['Cache-Control'], 'private')
+        self.assertIn('no-cache', self.client.get(
+            reverse('posts:index'))['Cache-Control'])
+        versions = get_versions([namespace('author', self.user.pk)])
+        Follow.objects.create(
+            user=User.objects.create_user(username='reader'),
+            author=self.user)
+        self.assertNotEqual(
+            get_versions([namespace('author', self.user.pk)]), versions)
+
+
+class SharedPageCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.first = User.objects.create_user(username='first')
+        cls.second = User.objects.create_user(username='second')
+        Post.objects.create(text='Пост', author=cls.first)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_index_cache_is_shared_without_user_header(self):
+        """Главная кэшируется одна на всех, шапка — своя у каждого."""
+        first_client = Client()
+        first_client.force_login(self.first)
+        second_client = Client()
+        second_client.force_login(self.second)
+        first = first_client.get(reverse('posts:index'))
+        Post.objects.update(text='Изменён в обход сигналов')
+        second = second_client.get(reverse('posts:index'))
+        guest = self.client.get(reverse('posts:index'))
+        self.assertContains(first, 'Пользователь: first')
+        self.assertContains(second, 'Пользователь: second')
+        self.assertNotContains(second, 'Пользователь: first')
+        self.assertContains(second, 'Пост')
+        self.assertContains(guest, 'Пост')
+        self.assertContains(guest, 'Войти')
+        self.assertNotContains(guest, 'Пользователь:')
+        self.assertEqual(second['Cache-Control'], 'private')
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.post = Post.objects.create(text='Пост', author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_unchanged_pages_answer_304_without_render(self):
+        """Совпавший ETag отдаёт 304 без рендера и без запросов ленты."""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:profile', kwargs={'username': 'author'}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertLessEqual(len(queries), 1)
+
+    def test_changes_and_users_get_new_etag(self):
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        response = self.client.get(url)
+        self.assertIn('Last-Modified', response)
+        etag = response['ETag']
+        Comment.objects.create(post=self.post, author=self.author, text='к')
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        etag = self.client.get(url)['ETag']
+        self.client.force_login(self.author)
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_new_csrf_secret_gets_new_etag(self):
+        """После повторного входа страница с формой не отдаётся из 304."""
+        self.author.set_password('password')
+        self.author.save()
+        client = Client(enforce_csrf_checks=True)
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+
+        def login():
+            client.get(reverse('users:login'))
+            client.post(reverse('users:login'), {
+                'username': 'author', 'password': 'password',
+                'csrfmiddlewaretoken':
+                    client.cookies[settings.CSRF_COOKIE_NAME].value,
+            })
+
+        login()
+        etag = client.get(url)['ETag']
+        client.get(reverse('users:logout'))
+        login()
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        response = client.post(
+            reverse('posts:add_comment', kwargs={'post_id': self.post.pk}),
+            {'text': 'Комментарий',
+             'csrfmiddlewaretoken': response.context['csrf_token']})
+        self.assertEqual(response.status_code, 302)
+
+
+class LookupKeyTests(TestCase):
+    def test_keys_are_safe_for_memcached(self):
+        for key in (group_lookup_key('Тестовый слаг'),
+                    author_lookup_key('ю' * 150)):
+            self.assertRegex(key, r'^lookup:\w+:[0-9a-f]{32}$')
+
+
+class LookupCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_missing_slugs_and_usernames_are_remembered(self):
+        """Перебор несуществующих адресов не доходит до базы."""
+        urls = (
+            reverse('posts:group_list', kwargs={'slug': 'nope'}),
+            reverse('posts:profile', kwargs={'username': 'nobody'}),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+                with CaptureQueriesContext(connection) as queries:
+                    self.assertEqual(self.client.get(url).status_code, 404)
+                self.assertEqual(len(queries), 0)
+
+    def test_lookups_follow_saves_and_deletes(self):
+        url = reverse('posts:group_list', kwargs={'slug': 'new'})
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.group.slug = 'new'
+        self.group.save()
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(self.client.get(reverse(
+            'posts:group_list', kwargs={'slug': 'group'})).status_code, 404)
+        profile = reverse('posts:profile', kwargs={'username': 'author'})
+        self.assertEqual(self.client.get(profile).status_code, 200)
+        User.objects.filter(pk=self.author.pk).delete()
+        self.assertEqual(self.client.get(profile).status_code, 404)
 
 
 class PostPaginatorTests(TestCase):
@@ -184,6 +359,7 @@ class PostPaginatorTests(TestCase):
         self.guest_client = Client()
         self.authorized_client = Client()
         self.authorized_client.force_login(self.user)
+        cache.clear()
 
     def test_first_page_contains_ten_posts(self):
         namespace_list = {
@@ -214,6 +390,347 @@ class PostPaginatorTests(TestCase):
             self.assertEqual(len(response.context['page_obj']), count_posts)
 
 
+class CursorPaginatorTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='author')
+        batch = [Post(author=cls.user, text=f'Пост {i}') for i in range(13)]
+        Post.objects.bulk_create(batch, batch_size=13)
+
+    def setUp(self):
+        self.guest_client = Client()
+        cache.clear()
+
+    @override_settings(POSTS_CURSOR_PAGINATION=True)
+    def test_cursor_pages_walk_feed(self):
+        """Курсоры ведут вперёд и назад по ленте без пропусков."""
+        url = reverse('posts:profile', kwargs={'username': 'author'})
+        first = self.guest_client.get(url).context['page_obj']
+        self.assertEqual(len(first), 10)
+        self.assertFalse(first.has_previous())
+        second = self.guest_client.get(
+            url, {'after': first.next_cursor}).context['page_obj']
+        self.assertEqual(len(second), 3)
+        self.assertFalse(second.has_next())
+        self.assertEqual(
+            set(first) | set(second), set(Post.objects.all())
+        )
+        back = self.guest_client.get(
+            url, {'before': second.previous_cursor}).context['page_obj']
+        self.assertEqual(list(back), list(first))
+
+    def test_broken_cursor_returns_first_page(self):
+        response = self.guest_client.get(
+            reverse('posts:index'), {'after': 'мусор'})
+        self.assertEqual(len(response.context['page_obj']), 10)
+
+
+class FeedCountTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_counts_follow_post_signals(self):
+        """Счётчики лент меняются вместе с постами и подписками."""
+        keys = (
+            feed_count_key('all'),
+            feed_count_key('group', self.group.pk),
+            feed_count_key('author', self.author.pk),
+            feed_count_key('follower', self.reader.pk),
+        )
+        for key in keys:
+            cache.set(key, 0)
+        post = Post.objects.create(
+            author=self.author, text='текст', group=self.group)
+        self.assertEqual(list(cache.get_many(keys[:3]).values()), [1] * 3)
+        self.assertIsNone(cache.get(keys[3]))
+        cache.set(keys[3], 1)
+        post.group = None
+        post.save()
+        self.assertEqual(cache.get(keys[1]), 0)
+        Follow.objects.filter(user=self.reader).delete()
+        self.assertEqual(cache.get(keys[3]), 0)
+        post.delete()
+        self.assertEqual(cache.get(keys[0]), 0)
+
+    def test_cold_cache_is_filled_from_estimate(self):
+        Post.objects.create(author=self.author, text='текст')
+        response = self.client.get(reverse('posts:index'))
+        self.assertEqual(response.context['page_obj'].paginator.count, 1)
+        self.assertEqual(cache.get(feed_count_key('all')), 1)
+
+    @override_settings(POSTS_CURSOR_PAGINATION=False)
+    def test_pages_past_low_estimate_are_reachable(self):
+        """Заниженная оценка не прячет старые посты за последней страницей."""
+        Post.objects.bulk_create(
+            [Post(author=self.author, text='старый') for _ in range(25)])
+        key = feed_count_key('author', self.author.pk)
+        cache.set(key, 12, 60)
+        cache.set(estimate_marker_key(key), True, 60)
+        url = reverse('posts:profile', kwargs={'username': 'author'})
+        page = self.client.get(url, {'page': 2}).context['page_obj']
+        self.assertEqual(len(page), 10)
+        self.assertTrue(page.has_next())
+        page = self.client.get(url, {'page': 3}).context['page_obj']
+        self.assertEqual((page.number, len(page)), (3, 5))
+        self.assertFalse(page.has_next())
+        page = self.client.get(url, {'page': 9}).context['page_obj']
+        self.assertEqual(page.number, 2)
+
+
+class CountersTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+
+    def setUp(self):
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+        cache.clear()
+
+    def test_counters_follow_views(self):
+        """Счётчики меняются вместе с постами, комментариями и подписками."""
+        self.author_client.post(reverse('posts:post_create'),
+                                data={'text': 'Пост'})
+        post = Post.objects.get()
+        self.reader_client.post(
+            reverse('posts:add_comment', kwargs={'post_id': post.pk}),
+            data={'text': 'Комментарий'})
+        self.reader_client.get(reverse(
+            'posts:profile_follow', kwargs={'username': 'author'}))
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        stats = AuthorStats.objects.get(author=self.author)
+        self.assertEqual((stats.posts_count, stats.followers_count), (1, 1))
+        self.assertEqual(self.reader.stats.following_count, 1)
+        self.reader_client.get(reverse(
+            'posts:profile_unfollow', kwargs={'username': 'author'}))
+        post.delete()
+        stats.refresh_from_db()
+        self.assertEqual((stats.posts_count, stats.followers_count), (0, 0))
+
+    def test_reconcile_counters_repairs_drift(self):
+        post = Post.objects.create(text='Пост', author=self.author)
+        Follow.objects.create(user=self.reader, author=self.author)
+        AuthorStats.objects.update(posts_count=7, followers_count=0)
+        AuthorStats.objects.filter(author=self.reader).delete()
+        Post.objects.update(comments_count=3)
+        call_command('reconcile_counters', batch_size=1, stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 0)
+        stats = AuthorStats.objects.get(author=self.author)
+        self.assertEqual((stats.posts_count, stats.followers_count), (1, 1))
+        self.assertEqual(
+            AuthorStats.objects.get(author=self.reader).following_count, 1)
+
+
+class FeedQueriesTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        self.client.force_login(self.reader)
+
+    def count_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        return len(queries)
+
+    def test_feed_queries_do_not_grow_with_posts(self):
+        """Число запросов ленты не зависит от числа карточек на странице."""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': 'group'}),
+            reverse('posts:profile', kwargs={'username': 'author'}),
+            reverse('posts:follow_index'),
+        )
+        Post.objects.create(text='Пост', author=self.author, group=self.group)
+        single = [self.count_queries(url) for url in urls]
+        for i in range(9):
+            group = Group.objects.create(title=f'Группа {i}', slug=f'g-{i}')
+            Post.objects.create(text='Пост', author=self.author, group=group)
+            Post.objects.create(text='Пост', author=self.author,
+                                group=self.group)
+        self.assertEqual([self.count_queries(url) for url in urls], single)
+
+
+class PostCardCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(
+            username='author', first_name='Лев', last_name='Толстой')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+
+    def setUp(self):
+        cache.clear()
+        self.post = Post.objects.create(
+            text='Старый текст', author=self.author, group=self.group)
+
+    def render_profile(self):
+        return self.client.get(
+            reverse('posts:profile', kwargs={'username': 'author'}))
+
+    def test_cards_are_reused_between_pages(self):
+        """Карточка рендерится один раз и берётся из кэша на других лентах."""
+        self.render_profile()
+        Post.objects.filter(pk=self.post.pk).update(text='Новый текст')
+        self.assertContains(self.render_profile(), 'Старый текст')
+        self.post.refresh_from_db()
+        self.post.save()
+        self.assertContains(self.render_profile(), 'Новый текст')
+
+    def test_card_follows_comments_author_and_group(self):
+        """Счётчик, имя автора и название группы сразу видны в карточке."""
+        self.render_profile()
+        Comment.objects.create(post=self.post, author=self.author, text='к')
+        self.author.first_name = 'Алексей'
+        self.author.save()
+        self.group.title = 'Переименована'
+        self.group.save()
+        response = self.render_profile()
+        self.assertContains(response, '<dd class="col-sm-9">1</dd>')
+        self.assertContains(response, 'Алексей Толстой', count=2)
+        self.assertContains(response, 'Переименована')
+
+    def test_comment_list_follows_changes_of_same_count(self):
+        """Список комментариев не держится за их число."""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        reader = User.objects.create_user(username='reader')
+        comment = Comment.objects.create(
+            post=self.post, author=reader, text='Первый')
+        self.assertContains(self.client.get(url), 'Первый')
+        comment.delete()
+        Comment.objects.create(post=self.post, author=reader, text='Второй')
+        response = self.client.get(url)
+        self.assertContains(response, 'Второй')
+        self.assertNotContains(response, 'Первый')
+        reader.username = 'renamed'
+        reader.save()
+        self.assertContains(self.client.get(url), 'renamed')
+
+    def test_author_rename_reaches_shared_pages(self):
+        """Новое имя автора сразу видно на главной и странице группы."""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': 'group'}),
+        )
+        for url in urls:
+            self.assertContains(self.client.get(url), 'Лев Толстой')
+        self.author.first_name = 'Алексей'
+        self.author.save()
+        for url in urls:
+            self.assertContains(self.client.get(url), 'Алексей Толстой')
+
+    def test_other_user_fields_keep_shared_pages(self):
+        """Вход и смена почты не сбрасывают кэш лент."""
+        versions = get_versions([namespace('authors')])
+        self.client.force_login(self.author)
+        self.author.email = 'author@example.com'
+        self.author.save()
+        self.assertEqual(get_versions([namespace('authors')]), versions)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailResolverTests(TestCase):
+    GIF = (
+        b'\x47\x49\x46\x38\x39\x61\x02\x00'
+        b'\x01\x00\x80\x00\x00\x00\x00\x00'
+        b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+        b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+        b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+        b'\x0A\x00\x3B'
+    )
+
+    def setUp(self):
+        cache.clear()
+        thumbnails._resolved.clear()
+        author = User.objects.create_user(username='author')
+        self.group = Group.objects.create(title='Группа', slug='group')
+        for number in range(3):
+            post = Post.objects.create(
+                text=f'Пост {number}', author=author, group=self.group,
+                image=SimpleUploadedFile(
+                    'small.gif', self.GIF, content_type='image/gif'),
+            )
+            thumbnails.generate(post.image.name)
+
+    def kvstore_queries(self):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse('posts:group_list', kwargs={'slug': 'group'}))
+        self.assertContains(response, 'width="960" height="339"', count=3)
+        return [
+            query for query in queries
+            if 'thumbnail_kvstore' in query['sql']
+        ]
+
+    def test_page_thumbnails_resolved_in_one_query(self):
+        self.assertEqual(len(self.kvstore_queries()), 1)
+
+    def test_resolved_thumbnails_are_kept_in_process(self):
+        self.kvstore_queries()
+        self.assertEqual(self.kvstore_queries(), [])
+
+    def test_card_url_matches_thumbnail_tag(self):
+        post = Post.objects.first()
+        picture = thumbnails.resolve_thumbnails([post.image])
+        url = get_thumbnail(
+            post.image, '960x339', crop='center', upscale=True).url
+        self.assertEqual(picture[post.image.name].url, url)
+
+    def test_pictures_offer_every_width(self):
+        post = Post.objects.first()
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.pk}))
+        for width in thumbnails.PICTURE_WIDTHS:
+            self.assertContains(response, f' {width}w')
+        self.assertContains(response, thumbnails.DETAIL_SIZES)
+
+    def test_pending_picture_has_no_renditions(self):
+        """Без миниатюр ни одного варианта не строится: только оригинал."""
+        post = Post.objects.first()
+        for geometry, options in thumbnails.THUMBNAIL_GEOMETRIES:
+            default.kvstore.delete(
+                thumbnails.thumbnail_file(post.image.name, geometry, options))
+        thumbnails._resolved.clear()
+        with mock.patch.object(
+            default.backend, '_create_thumbnail'
+        ) as create:
+            response = self.client.get(
+                reverse('posts:post_detail', kwargs={'post_id': post.pk}))
+        create.assert_not_called()
+        self.assertContains(response, f'src="{post.image.url}"')
+        self.assertContains(response, 'object-fit: cover')
+        self.assertNotContains(response, 'srcset')
+
+    @skipUnless(thumbnails.WEBP_SUPPORTED, 'Pillow собран без WebP')
+    def test_pictures_offer_webp(self):
+        response = self.client.get(
+            reverse('posts:group_list', kwargs={'slug': 'group'}))
+        self.assertContains(response, 'type="image/webp"', count=3)
+        self.assertContains(response, '.webp 960w', count=3)
+
+
 class FollowTests(TestCase):
 
     @classmethod
@@ -275,3 +792,85 @@ class FollowTests(TestCase):
             'posts:follow_index'))
         posts_cnt_new = len(response.context['page_obj'].object_list)
         self.assertEqual(posts_cnt_new, 0)
+
+    @override_settings(POSTS_TIMELINE_LENGTH=2)
+    def test_timeline_is_trimmed(self):
+        """trim_timelines оставляет POSTS_TIMELINE_LENGTH постов в ленте."""
+        for i in range(3):
+            Post.objects.create(text=f'Пост {i}', author=self.author)
+        entries = TimelineEntry.objects.filter(user=self.subscriber)
+        self.assertEqual(entries.count(), 4)
+        call_command('trim_timelines', stdout=StringIO())
+        self.assertEqual(entries.count(), 2)
+        self.assertFalse(entries.filter(post=self.post).exists())
+
+    def test_deferred_posts_load_in_one_query(self):
+        """post_init не догружает group_id у постов из only()."""
+        for i in range(5):
+            Post.objects.create(text=f'Пост {i}', author=self.author)
+        with self.assertNumQueries(1):
+            list(Post.objects.only('pk', 'author_id', 'pub_date'))
+
+    def test_fan_out_is_constant_per_post(self):
+        """Публикация не ходит в базу отдельно по каждому подписчику."""
+        readers = [
+            User.objects.create_user(username=f'reader{i}')
+            for i in range(5)
+        ]
+        for reader in readers[:1]:
+            Follow.objects.create(user=reader, author=self.author)
+        with CaptureQueriesContext(connection) as few:
+            Post.objects.create(text='Пост', author=self.author)
+        for reader in readers[1:]:
+            Follow.objects.create(user=reader, author=self.author)
+        with CaptureQueriesContext(connection) as many:
+            Post.objects.create(text='Ещё пост', author=self.author)
+        self.assertEqual(len(few), len(many))
+
+    def test_follow_backfills_and_unfollow_purges(self):
+        self.subscriber_2_client.get(
+            reverse('posts:profile_follow', kwargs={'username': self.author})
+        )
+        response = self.subscriber_2_client.get(reverse('posts:follow_index'))
+        self.assertIn(self.post, response.context['page_obj'])
+        self.subscriber_2_client.get(
+            reverse('posts:profile_unfollow', kwargs={'username': self.author})
+        )
+        self.assertFalse(
+            TimelineEntry.objects.filter(user=self.subscriber_2).exists())
+
+    def test_rebuild_timelines_command(self):
+        TimelineEntry.objects.all().delete()
+        call_command('rebuild_timelines', stdout=StringIO())
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.subscriber, post=self.post).exists())
+
+    @override_settings(POSTS_FANOUT_THRESHOLD=1)
+    def test_popular_author_is_pulled_on_read(self):
+        """Посты автора-знаменитости подмешиваются в ленту при чтении."""
+        Follow.objects.create(user=self.subscriber_2, author=self.author)
+        self.assertTrue(PullAuthor.objects.filter(author=self.author).exists())
+        post = Post.objects.create(text='Новый пост', author=self.author)
+        self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+        response = self.subscriber_2_client.get(reverse('posts:follow_index'))
+        self.assertEqual(list(response.context['page_obj']), [post, self.post])
+        Follow.objects.filter(user=self.subscriber_2).delete()
+        self.assertTrue(
+            PullAuthor.objects.filter(author=self.author).exists())
+        with override_settings(POSTS_FANOUT_RESUME_THRESHOLD=1):
+            call_command('resume_fanout', stdout=StringIO())
+        self.assertFalse(
+            PullAuthor.objects.filter(author=self.author).exists())
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.subscriber, post=post).exists())
+
+    @override_settings(POSTS_FANOUT_THRESHOLD=1,
+                       POSTS_FANOUT_RESUME_THRESHOLD=0)
+    def test_author_at_threshold_does_not_flip_mode(self):
+        """Между порогами режим не меняется ни подпиской, ни командой."""
+        for _ in range(3):
+            Follow.objects.create(user=self.subscriber_2, author=self.author)
+            Follow.objects.filter(user=self.subscriber_2).delete()
+        call_command('resume_fanout', stdout=StringIO())
+        self.assertTrue(
+            PullAuthor.objects.filter(author=self.author).exists())
@@ -0,0 +1,302 @@
+import logging
+import threading
+from collections import OrderedDict, namedtuple
+
+import django
+from PIL import features
+from sorl.thumbnail import default, delete, get_thumbnail
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import KVStore
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from core.versions import bump
+
+from .models import Post, ThumbnailJob
+from .utils import post_namespaces
+
+logger = logging.getLogger(__name__)
+
+# Картинка поста в карточках и на странице поста: кадр 960x339 в
+# нескольких ширинах, в формате sorl по умолчанию и в WebP, если Pillow
+# собран с libwebp. Браузер выбирает вариант по srcset и sizes.
+PICTURE_WIDTHS = (320, 640, 960)
+PICTURE_RATIO = 339 / 960
+PICTURE_OPTIONS = {'crop': 'center', 'upscale': True}
+WEBP_SUPPORTED = features.check('webp')
+
+CARD_SIZES = '(max-width: 992px) 100vw, 960px'
+DETAIL_SIZES = '(max-width: 768px) 100vw, 75vw'
+
+
+def picture_renditions():
+    """(geometry, options, webp) всех вариантов картинки поста."""
+    formats = (False, True) if WEBP_SUPPORTED else (False,)
+    renditions = []
+    for webp in formats:
+        options = dict(PICTURE_OPTIONS, format='WEBP') if webp else (
+            PICTURE_OPTIONS)
+        for width in PICTURE_WIDTHS:
+            geometry = f'{width}x{round(width * PICTURE_RATIO)}'
+            renditions.append((geometry, options, webp))
+    return tuple(renditions)
+
+
+# Все миниатюры из шаблонов; их собирает только воркер. Новый размер в
+# шаблоне добавляется и сюда, иначе его никто не соберёт.
+PICTURE_RENDITIONS = picture_renditions()
+THUMBNAIL_GEOMETRIES = tuple(
+    (geometry, options) for geometry, options, _ in PICTURE_RENDITIONS
+)
+
+RESOLVED_MAX_ENTRIES = 3000
+
+Thumbnail = namedtuple('Thumbnail', 'url width height')
+Picture = namedtuple(
+    'Picture', 'url width height srcset webp_srcset sizes pending')
+
+_resolved = OrderedDict()
+_resolved_lock = threading.Lock()
+
+
+def source_file(name):
+    """Картинка поста по имени в хранилище поля Post.image.
+
+    Хранилище входит в ключи kvstore, поэтому голое имя, которое sorl
+    отнёс бы к THUMBNAIL_STORAGE, дало бы другие миниатюры.
+    """
+    return ImageFile(name, Post._meta.get_field('image').storage)
+
+
+def generate(name):
+    """Миниатюры всех размеров; уже собранные берутся из kvstore."""
+    for geometry, options in THUMBNAIL_GEOMETRIES:
+        get_thumbnail(source_file(name), geometry, **options)
+
+
+def regenerate(name):
+    """Выбрасывает старые миниатюры файла и собирает заново.
+
+    Миниатюры удаляются и по списку в kvstore, и по вычисленным именам:
+    файл мог остаться, даже если kvstore о нём забыл.
+
+    Ошибку пишет в лог и возвращает False: один битый файл не должен
+    останавливать весь пул.
+    """
+    try:
+        delete(source_file(name), delete_file=False)
+        for geometry, options in THUMBNAIL_GEOMETRIES:
+            thumbnail = thumbnail_file(name, geometry, options)
+            default.kvstore.delete(thumbnail)
+            if thumbnail.exists():
+                thumbnail.delete()
+        generate(name)
+    except Exception:
+        logger.exception('Не удалось собрать миниатюры %s', name)
+        return False
+    return True
+
+
+def enqueue_thumbnails(image):
+    if image:
+        ThumbnailJob.objects.get_or_create(image=image.name)
+
+
+def refresh_pages(name):
+    """Сбрасывает страницы с постами этой картинки.
+
+    Пока миниатюр не было, страницы показывали оригинал; после сборки
+    их кэш и ETag должны смениться.
+    """
+    posts = Post.objects.filter(image=name).only('author_id', 'group_id')
+    spaces = [space for post in posts for space in post_namespaces(post)]
+    if spaces:
+        bump(*spaces)
+
+
+def process_jobs(limit=100):
+    """Забирает до limit задач из очереди и возвращает число обработанных.
+
+    Задачу забирает тот воркер, чей DELETE удалил строку, так что
+    несколько воркеров не собирают одно и то же.
+    """
+    done = 0
+    jobs = ThumbnailJob.objects.values_list('pk', 'image')[:limit]
+    for pk, name in list(jobs):
+        deleted, _ = ThumbnailJob.objects.filter(pk=pk).delete()
+        if not deleted:
+            continue
+        try:
+            generate(name)
+        except Exception:
+            logger.exception('Не удалось собрать миниатюры %s', name)
+        else:
+            refresh_pages(name)
+        done += 1
+    return done
+
+
+def setup_worker():
+    """Инициализатор процессов пула: при spawn Django нужно поднять."""
+    django.setup()
+
+
+def thumbnail_file(name, geometry, options):
+    """ImageFile миниатюры без обращения к хранилищу и kvstore.
+
+    Опции дополняются так же, как в ThumbnailBackend.get_thumbnail, чтобы
+    имя файла и ключ совпали с теми, что строит {% thumbnail %}.
+    """
+    backend = default.backend
+    source = source_file(name)
+    options = dict(options)
+    if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(sorl_settings, attr)
+        if value != getattr(sorl_defaults, attr):
+            options.setdefault(key, value)
+    thumbnail_name = backend._get_thumbnail_filename(
+        source, geometry, options)
+    return ImageFile(thumbnail_name, default.storage)
+
+
+def remember(key, thumbnail):
+    with _resolved_lock:
+        _resolved[key] = thumbnail
+        _resolved.move_to_end(key)
+        while len(_resolved) > RESOLVED_MAX_ENTRIES:
+            _resolved.popitem(last=False)
+
+
+def recall(keys):
+    """Миниатюры, уже найденные этим процессом."""
+    found = {}
+    with _resolved_lock:
+        for key in keys:
+            if key in _resolved:
+                _resolved.move_to_end(key)
+                found[key] = _resolved[key]
+    return found
+
+
+def resolve_thumbnail(stored):
+    """Thumbnail из записи kvstore; без записи — None.
+
+    Страница миниатюр не строит: это работа воркера.
+    """
+    if stored is None:
+        return None
+    image_file = deserialize_image_file(stored)
+    if not image_file.size:
+        return None
+    width, height = image_file.size
+    return Thumbnail(default.storage.url(image_file.name), width, height)
+
+
+def load_stored(keys):
+    """Сериализованные миниатюры из kvstore: get_many и один запрос."""
+    if not isinstance(default.kvstore, KVStore):
+        return {}
+    kv_cache = default.kvstore.cache
+    found = {
+        key: value for key, value in kv_cache.get_many(keys).items()
+        if isinstance(value, str)
+    }
+    rest = [key for key in keys if key not in found]
+    if rest:
+        stored = dict(
+            KVStoreModel.objects.filter(key__in=rest).values_list(
+                'key', 'value')
+        )
+        if stored:
+            kv_cache.set_many(stored, sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+        found.update(stored)
+    return found
+
+
+def srcset(thumbnails):
+    return ', '.join(
+        f'{thumbnail.url} {thumbnail.width}w' for thumbnail in thumbnails)
+
+
+def make_picture(thumbnails, sizes):
+    """Picture из миниатюр одной картинки: [(webp, Thumbnail), ...]."""
+    plain = sorted(
+        (thumbnail for webp, thumbnail in thumbnails if not webp),
+        key=lambda thumbnail: thumbnail.width,
+    )
+    if not plain:
+        return None
+    webp = sorted(
+        (thumbnail for webp, thumbnail in thumbnails if webp),
+        key=lambda thumbnail: thumbnail.width,
+    )
+    largest = plain[-1]
+    return Picture(
+        largest.url, largest.width, largest.height,
+        srcset(plain), srcset(webp), sizes, False,
+    )
+
+
+def fallback_picture(name, sizes):
+    """Оригинал в кадре карточки, пока воркер не собрал миниатюры."""
+    width = PICTURE_WIDTHS[-1]
+    return Picture(
+        source_file(name).url, width, round(width * PICTURE_RATIO),
+        '', '', sizes, True,
+    )
+
+
+def enqueue_pending(names):
+    """Ставит в очередь картинки без миниатюр: задача могла потеряться."""
+    ThumbnailJob.objects.bulk_create(
+        [ThumbnailJob(image=name) for name in names],
+        ignore_conflicts=True,
+    )
+
+
+def resolve_thumbnails(images, sizes=CARD_SIZES):
+    """Все варианты картинок страницы для <picture>: {имя: Picture}.
+
+    Вместо запроса в kvstore на каждую миниатюру — память процесса,
+    затем один get_many и один запрос на остаток. Картинка без
+    миниатюр показывается оригиналом (Picture.pending) и снова ставится
+    в очередь воркеру.
+    """
+    wanted = {}
+    for image in images:
+        if not image or image.name in wanted:
+            continue
+        wanted[image.name] = [
+            add_prefix(thumbnail_file(image.name, geometry, options).key)
+            for geometry, options, _ in PICTURE_RENDITIONS
+        ]
+    resolved = recall(key for keys in wanted.values() for key in keys)
+    missing = [
+        key for keys in wanted.values() for key in keys
+        if key not in resolved
+    ]
+    stored = load_stored(missing) if missing else {}
+    pictures = {}
+    for name, keys in wanted.items():
+        thumbnails = []
+        for (_, _, webp), key in zip(PICTURE_RENDITIONS, keys):
+            thumbnail = resolved.get(key)
+            if thumbnail is None:
+                thumbnail = resolve_thumbnail(stored.get(key))
+                if thumbnail is None:
+                    continue
+                remember(key, thumbnail)
+            thumbnails.append((webp, thumbnail))
+        pictures[name] = make_picture(thumbnails, sizes)
+    pending = [name for name, picture in pictures.items() if picture is None]
+    if pending:
+        enqueue_pending(pending)
+        for name in pending:
+            pictures[name] = fallback_picture(name, sizes)
+    return pictures
@@ -0,0 +1,203 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q
+
+from .models import AuthorStats, Follow, Post, PullAuthor, TimelineEntry
+from .utils import change_feed_count, feed_count_key
+
+
+def timeline_length():
+    return getattr(settings, 'POSTS_TIMELINE_LENGTH', 1000)
+
+
+def fanout_threshold():
+    return getattr(settings, 'POSTS_FANOUT_THRESHOLD', 1000)
+
+
+def resume_threshold():
+    return getattr(
+        settings, 'POSTS_FANOUT_RESUME_THRESHOLD', fanout_threshold() * 4 // 5)
+
+
+def recent_length():
+    return getattr(settings, 'POSTS_PULL_RECENT_LENGTH', 200)
+
+
+def recent_posts_key(author_id):
+    return f'author-recent:{author_id}'
+
+
+def is_pull_author(author_id):
+    return PullAuthor.objects.filter(author_id=author_id).exists()
+
+
+def make_entry(user_id, post):
+    return TimelineEntry(
+        user_id=user_id,
+        post_id=post.pk,
+        author_id=post.author_id,
+        pub_date=post.pub_date,
+    )
+
+
+def trim_timeline(user_id):
+    """Обрезает ленту до POSTS_TIMELINE_LENGTH последних записей."""
+    entries = TimelineEntry.objects.filter(user_id=user_id)
+    border = entries.order_by('-pub_date', '-post_id').values_list(
+        'pub_date', 'post_id')[timeline_length():timeline_length() + 1]
+    if not border:
+        return 0
+    pub_date, post_id = border[0]
+    trimmed, _ = entries.filter(pub_date__lte=pub_date).exclude(
+        pub_date=pub_date, post_id__gt=post_id).delete()
+    change_feed_count(feed_count_key('follower', user_id), -trimmed)
+    return trimmed
+
+
+def overgrown_timelines():
+    """id пользователей, чьи ленты длиннее POSTS_TIMELINE_LENGTH."""
+    return TimelineEntry.objects.values('user_id').annotate(
+        total=Count('pk')).filter(total__gt=timeline_length()).order_by(
+        'user_id').values_list('user_id', flat=True)
+
+
+def trim_timelines():
+    """Обрезает все переросшие ленты; возвращает (лент, записей)."""
+    user_ids = list(overgrown_timelines())
+    return len(user_ids), sum(trim_timeline(pk) for pk in user_ids)
+
+
+def fan_out_post(post):
+    """Раскладывает новый пост по лентам подписчиков автора.
+
+    Запрос публикации делает одну вставку и одно удаление счётчиков из
+    кэша; ленты, переросшие POSTS_TIMELINE_LENGTH, обрезает периодическая
+    команда trim_timelines.
+    """
+    if is_pull_author(post.author_id):
+        cache.delete(recent_posts_key(post.author_id))
+        return
+    followers = list(Follow.objects.filter(
+        author_id=post.author_id).values_list('user_id', flat=True))
+    if not followers:
+        return
+    TimelineEntry.objects.bulk_create(
+        [make_entry(user_id, post) for user_id in followers],
+        ignore_conflicts=True,
+    )
+    cache.delete_many(
+        [feed_count_key('follower', user_id) for user_id in followers])
+
+
+def backfill_timeline(user_id, author_id):
+    """Добавляет в ленту подписчика последние посты нового автора."""
+    cache.delete(feed_count_key('follower', user_id))
+    if is_pull_author(author_id):
+        return
+    posts = Post.objects.filter(author_id=author_id).only(
+        'pk', 'author_id', 'pub_date')[:timeline_length()]
+    with transaction.atomic():
+        TimelineEntry.objects.bulk_create(
+            [make_entry(user_id, post) for post in posts],
+            ignore_conflicts=True,
+        )
+        trim_timeline(user_id)
+
+
+def purge_timeline(user_id, author_id):
+    """Убирает из ленты подписчика посты автора, от которого он отписался."""
+    purged, _ = TimelineEntry.objects.filter(
+        user_id=user_id, author_id=author_id).delete()
+    change_feed_count(feed_count_key('follower', user_id), -purged)
+
+
+def rebuild_timeline(user_id):
+    """Собирает ленту пользователя заново из его подписок."""
+    posts = Post.objects.filter(
+        author__following__user_id=user_id
+    ).order_by('-pub_date', '-pk').only(
+        'pk', 'author_id', 'pub_date')[:timeline_length()]
+    with transaction.atomic():
+        TimelineEntry.objects.filter(user_id=user_id).delete()
+        entries = TimelineEntry.objects.bulk_create(
+            [make_entry(user_id, post) for post in posts]
+        )
+    cache.delete(feed_count_key('follower', user_id))
+    return len(entries)
+
+
+def followers_count(author_id):
+    return AuthorStats.objects.filter(pk=author_id).values_list(
+        'followers_count', flat=True).first() or 0
+
+
+def update_author_mode(author_id):
+    """Переводит автора на чтение при показе, когда подписчиков больше
+    POSTS_FANOUT_THRESHOLD.
+
+    Вызывается при каждой подписке и стоит одного чтения AuthorStats.
+    Обратный переход раскладывает посты по лентам всех подписчиков, поэтому
+    он идёт не в запросе, а в команде resume_fanout, и только ниже
+    POSTS_FANOUT_RESUME_THRESHOLD: автор у порога не переключается туда и
+    обратно на каждой подписке и отписке.
+    """
+    if followers_count(author_id) > fanout_threshold():
+        PullAuthor.objects.get_or_create(author_id=author_id)
+
+
+def push_author(author_id):
+    """Возвращает автора к раскладке и заполняет ленты его подписчиков.
+
+    Сначала снимаем режим чтения, чтобы новые посты уже раскладывались, а
+    потом добираем старые: повторы отсеивает ignore_conflicts.
+    """
+    PullAuthor.objects.filter(author_id=author_id).delete()
+    cache.delete(recent_posts_key(author_id))
+    followers = Follow.objects.filter(author_id=author_id).values_list(
+        'user_id', flat=True)
+    for user_id in followers.iterator():
+        backfill_timeline(user_id, author_id)
+
+
+def resume_fanout():
+    """Возвращает к раскладке авторов, у которых стало мало подписчиков."""
+    author_ids = list(PullAuthor.objects.filter(
+        author__stats__followers_count__lte=resume_threshold()
+    ).values_list('author_id', flat=True))
+    for author_id in author_ids:
+        push_author(author_id)
+    return len(author_ids)
+
+
+def recent_post_ids(author_ids):
+    """Возвращает id последних постов авторов, читая кэш одним запросом."""
+    keys = {recent_posts_key(pk): pk for pk in author_ids}
+    cached = cache.get_many(keys)
+    post_ids = []
+    for key, author_id in keys.items():
+        if key not in cached:
+            cached[key] = list(Post.objects.filter(
+                author_id=author_id
+            ).values_list('pk', flat=True)[:recent_length()])
+            cache.set(key, cached[key])
+        post_ids.extend(cached[key])
+    return post_ids
+
+
+def follow_feed(user):
+    """Лента подписок: разложенные записи плюс посты авторов-знаменитостей.
+
+    Возвращает queryset постов и флаг, есть ли в ленте подмешанные авторы.
+    """
+    pull_authors = list(PullAuthor.objects.filter(
+        author__following__user=user).values_list('author_id', flat=True))
+    timeline = TimelineEntry.objects.filter(user=user).values('post_id')
+    if not pull_authors:
+        posts = Post.objects.filter(timeline_entries__user=user).order_by(
+            '-timeline_entries__pub_date', '-timeline_entries__post')
+        return posts, False
+    posts = Post.objects.filter(
+        Q(pk__in=timeline) | Q(pk__in=recent_post_ids(pull_authors))
+    ).order_by('-pub_date', '-pk')
+    return posts, True
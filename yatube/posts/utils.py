@@ -1,8 +1,286 @@
-from django.core.paginator import Paginator
+import base64
+import binascii
 
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import EmptyPage, Page, Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
 
-def paginator_posts(request, posts):
-    paginator = Paginator(posts, 10)
+from core.versions import namespace
+
+from .models import Post
+
+POSTS_PER_PAGE = 10
+FEED_COUNT_TIMEOUT = 60 * 60 * 24
+FEED_ESTIMATE_TIMEOUT = 60 * 5
+FEED_ESTIMATE_LIMIT = POSTS_PER_PAGE * 100
+
+CARD_FIELDS = (
+    'excerpt', 'excerpt_truncated', 'pub_date', 'updated', 'image',
+    'comments_count',
+    'author__username', 'author__first_name', 'author__last_name',
+    'group__title', 'group__slug',
+)
+
+
+def feed_queryset(posts=None):
+    """Посты для карточек ленты: автор и группа одним JOIN, без лишних колонок.
+
+    Всё, что рисует карточка, либо лежит в строке поста (comments_count),
+    либо приходит через select_related, поэтому prefetch не нужен и число
+    запросов на страницу не зависит от числа карточек.
+    """
+    if posts is None:
+        posts = Post.objects.all()
+    return posts.select_related('author', 'group').only(*CARD_FIELDS)
+
+
+def feed_count_key(feed, pk=None):
+    """Ключ кэша со счётчиком ленты: all, group, author или follower."""
+    if pk is None:
+        return f'feed-count:{feed}'
+    return f'feed-count:{feed}:{pk}'
+
+
+def post_namespaces(post, group_id=None):
+    """Пространства кэша, где виден пост: лента, группа, автор, сам пост."""
+    spaces = [namespace('feed'), namespace('post', post.pk)]
+    if post.author_id is not None:
+        spaces.append(namespace('author', post.author_id))
+    for pk in {post.group_id, group_id} - {None}:
+        spaces.append(namespace('group', pk))
+    return spaces
+
+
+def change_feed_count(key, delta):
+    """Сдвигает счётчик, только если он уже прогрет."""
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        pass
+
+
+def estimate_feed_count(posts):
+    """Считает ленту не дальше FEED_ESTIMATE_LIMIT строк.
+
+    Возвращает пару (count, exact): короткая лента считается точно,
+    длинная оценивается по плотности последних постов в диапазоне id.
+    """
+    limit = FEED_ESTIMATE_LIMIT
+    sample = list(
+        posts.order_by('-pk').values_list('pk', flat=True)[:limit + 1]
+    )
+    if len(sample) <= limit:
+        return len(sample), True
+    oldest = posts.order_by('pk').values_list('pk', flat=True).first()
+    density = len(sample) / (sample[0] - sample[-1] + 1)
+    return max(len(sample), round(density * (sample[0] - oldest + 1))), False
+
+
+def encode_cursor(post):
+    raw = f'{post.pub_date.isoformat()}|{post.pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Возвращает пару (pub_date, id) или None для битого курсора."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        pub_date, pk = raw.rsplit('|', 1)
+        pub_date = parse_datetime(pub_date)
+        pk = int(pk)
+    except (ValueError, UnicodeError, binascii.Error):
+        return None
+    if pub_date is None:
+        return None
+    return pub_date, pk
+
+
+def estimate_marker_key(count_key):
+    return f'{count_key}:estimate'
+
+
+class CachedCountPaginator(Paginator):
+    """Паджинатор, который берёт число постов из кэша, а не из COUNT(*).
+
+    Оценка длинной ленты может быть меньше настоящей, поэтому по ней
+    только рисуются номера страниц. Последнюю оценочную страницу и всё,
+    что дальше, читаем с лишней строкой: есть строки — страница есть,
+    есть лишняя — есть и следующая.
+    """
+
+    def __init__(self, object_list, per_page, count_key, timeout=None):
+        super().__init__(object_list, per_page)
+        self.count_key = count_key
+        self.timeout = timeout
+        self.exact = True
+        self._probed = {}
+
+    @cached_property
+    def count(self):
+        marker_key = estimate_marker_key(self.count_key)
+        found = cache.get_many([self.count_key, marker_key])
+        if self.count_key in found:
+            self.exact = marker_key not in found
+            return found[self.count_key]
+        count, exact = estimate_feed_count(self.object_list)
+        timeout = FEED_COUNT_TIMEOUT if exact else FEED_ESTIMATE_TIMEOUT
+        if self.timeout is not None:
+            timeout = min(timeout, self.timeout)
+        if exact:
+            cache.delete(marker_key)
+        else:
+            cache.set(marker_key, True, timeout)
+        cache.add(self.count_key, count, timeout)
+        self.exact = exact
+        return count
+
+    def probe(self, number):
+        """Строки страницы number и одна сверх неё, без оглядки на count."""
+        if number not in self._probed:
+            bottom = (number - 1) * self.per_page
+            self._probed[number] = list(
+                self.object_list[bottom:bottom + self.per_page + 1])
+        return self._probed[number]
+
+    def beyond_estimate(self, number):
+        # num_pages первым: count заодно выясняет, точное ли число.
+        return number >= self.num_pages and not self.exact
+
+    def validate_number(self, number):
+        try:
+            return super().validate_number(number)
+        except EmptyPage:
+            number = int(number)
+            if number < 1 or not self.beyond_estimate(number) \
+                    or not self.probe(number):
+                raise
+            return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if not self.beyond_estimate(number):
+            return super().page(number)
+        rows = self.probe(number)
+        return ProbedPage(
+            rows[:self.per_page], number, self,
+            has_next=len(rows) > self.per_page)
+
+
+class ProbedPage(Page):
+    """Страница за оценкой числа постов: соседи известны из выборки."""
+
+    def __init__(self, object_list, number, paginator, has_next):
+        super().__init__(object_list, number, paginator)
+        self._has_next = has_next
+
+    def has_next(self):
+        return self._has_next
+
+    def next_page_number(self):
+        return self.number + 1
+
+    def start_index(self):
+        if not self.object_list:
+            return 0
+        return (self.number - 1) * self.paginator.per_page + 1
+
+    def end_index(self):
+        return self.start_index() + len(self.object_list) - 1
+
+
+class CursorPaginator(Paginator):
+    """Паджинатор по ключу (pub_date, id) без COUNT(*) и OFFSET."""
+
+    def __init__(self, object_list, per_page, after=None, before=None):
+        super().__init__(object_list, per_page)
+        self.after = after
+        self.before = before
+
+    def get_page(self, number=None):
+        after = decode_cursor(self.after) if self.after else None
+        before = decode_cursor(self.before) if self.before else None
+        posts = self.object_list
+        if before is not None:
+            pub_date, pk = before
+            posts = posts.filter(
+                Q(pub_date__gt=pub_date) | Q(pub_date=pub_date, pk__gt=pk)
+            ).order_by('pub_date', 'pk')
+        else:
+            if after is not None:
+                pub_date, pk = after
+                posts = posts.filter(
+                    Q(pub_date__lt=pub_date)
+                    | Q(pub_date=pub_date, pk__lt=pk)
+                )
+            posts = posts.order_by('-pub_date', '-pk')
+        rows = list(posts[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if before is not None:
+            rows.reverse()
+            return CursorPage(
+                rows, self, has_next=True, has_previous=has_more
+            )
+        return CursorPage(
+            rows, self, has_next=has_more, has_previous=after is not None
+        )
+
+
+class CursorPage(Page):
+    is_cursor = True
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        super().__init__(object_list, 1, paginator)
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if self._has_next and self.object_list:
+            return encode_cursor(self.object_list[-1])
+        return None
+
+    @property
+    def previous_cursor(self):
+        if self._has_previous and self.object_list:
+            return encode_cursor(self.object_list[0])
+        return None
+
+    def start_index(self):
+        return 1 if self.object_list else 0
+
+    def end_index(self):
+        return len(self.object_list)
+
+
+def paginator_posts(request, posts, count_key=None, count_timeout=None):
+    after = request.GET.get('after')
+    before = request.GET.get('before')
+    if after or before or getattr(
+        settings, 'POSTS_CURSOR_PAGINATION', False
+    ):
+        paginator = CursorPaginator(
+            posts, POSTS_PER_PAGE, after=after, before=before
+        )
+        return paginator.get_page()
+    if count_key is not None:
+        paginator = CachedCountPaginator(
+            posts, POSTS_PER_PAGE, count_key, count_timeout)
+    else:
+        paginator = Paginator(posts, POSTS_PER_PAGE)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
     return page_obj
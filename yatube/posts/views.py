@@ -1,50 +1,105 @@
 from django.contrib.auth.decorators import login_required
-from django.views.decorators.cache import cache_page
 from django.shortcuts import render, get_object_or_404, redirect
-from .utils import paginator_posts
-from .models import Post, Group, User, Follow
+from core.decorators import (cache_shared_page, conditional_page, cookieless,
+                             request_versions)
+from core.uploads import upload_errors
+from core.versions import namespace, versioned_key
+from .counters import get_author_stats
+from .lookups import (find_author, find_group, get_author_or_404,
+                      get_group_or_404)
+from .thumbnails import enqueue_thumbnails
+from .timelines import follow_feed
+from .utils import (FEED_ESTIMATE_TIMEOUT, feed_count_key, feed_queryset,
+                    paginator_posts)
+from .models import Post, Follow
 from .forms import PostForm, CommentForm
 
+PAGE_CACHE_TIMEOUT = 60 * 60 * 6
 
-@cache_page(20)
+
+def feed_namespaces(request):
+    # authors: имена авторов на карточках, см. signals.refresh_author.
+    return [namespace('feed'), namespace('authors')]
+
+
+def group_namespaces(request, slug):
+    group = find_group(slug)
+    return [namespace('group', group and group.pk), namespace('authors')]
+
+
+def author_namespaces(request, username):
+    author = find_author(username)
+    return [namespace('author', author and author.pk), namespace('groups')]
+
+
+def post_namespaces(request, post_id):
+    author_id = Post.objects.filter(
+        pk=post_id).values_list('author_id', flat=True).first()
+    return [namespace('post', post_id), namespace('author', author_id),
+            namespace('groups'), namespace('authors')]
+
+
+@cookieless
+@conditional_page(feed_namespaces)
+@cache_shared_page(PAGE_CACHE_TIMEOUT, feed_namespaces)
 def index(request):
-    posts = Post.objects.all()
+    posts = feed_queryset()
     context = {
-        'page_obj': paginator_posts(request, posts),
+        'page_obj': paginator_posts(
+            request, posts, feed_count_key('all')),
     }
     return render(request, 'posts/index.html', context)
 
 
+@cookieless
+@conditional_page(group_namespaces)
+@cache_shared_page(PAGE_CACHE_TIMEOUT, group_namespaces)
 def group_posts(request, slug):
-    group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
+    group = get_group_or_404(slug)
+    posts = feed_queryset(group.posts.all())
     context = {
         'group': group,
-        'page_obj': paginator_posts(request, posts),
+        'page_obj': paginator_posts(
+            request, posts, feed_count_key('group', group.pk)),
     }
     return render(request, 'posts/group_list.html', context)
 
 
+@cookieless
+@conditional_page(author_namespaces)
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    posts = author.posts.all()
+    author = get_author_or_404(username)
+    posts = feed_queryset(author.posts.all())
     following = request.user.is_authenticated and author.following.filter(
         user=request.user).exists()
     context = {
         'author': author,
-        'page_obj': paginator_posts(request, posts),
+        'stats': get_author_stats(author),
+        'page_obj': paginator_posts(
+            request, posts, feed_count_key('author', author.pk)),
         'following': following
     }
     return render(request, 'posts/profile.html', context)
 
 
+@cookieless
+@conditional_page(post_namespaces)
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_object_or_404(
+        Post.objects.select_related('author', 'group').defer('text'),
+        pk=post_id)
     form = CommentForm()
     comments = post.comments.select_related('author').all()
+    # Сигналы комментариев сдвигают версию post:<pk>, переименование
+    # комментатора — authors; версии уже прочитаны conditional_page.
+    _, versions = request_versions(
+        request, post_namespaces, (), {'post_id': post_id})
     context = {
         'post': post,
+        'stats': get_author_stats(post.author),
         'comments': comments,
+        'comments_version': versioned_key('comments', [
+            namespace('post', post_id), namespace('authors')], versions),
         'form': form,
     }
     return render(request, 'posts/post_detail.html', context)
@@ -54,12 +109,14 @@ def post_detail(request, post_id):
 def post_create(request):
     form = PostForm(
         request.POST or None,
-        files=request.FILES or None
+        files=request.FILES or None,
+        upload_errors=upload_errors(request)
     )
     if form.is_valid():
-        post = form.save(commit=True)
+        post = form.save(commit=False)
         post.author = request.user
         post.save()
+        enqueue_thumbnails(post.image)
         return redirect('posts:profile', request.user)
     context = {
         'form': form,
@@ -75,10 +132,13 @@ def post_edit(request, post_id):
     form = PostForm(
         request.POST or None,
         files=request.FILES or None,
-        instance=post
+        instance=post,
+        upload_errors=upload_errors(request)
     )
     if form.is_valid():
         form.save()
+        if 'image' in form.changed_data:
+            enqueue_thumbnails(post.image)
         return redirect('posts:post_detail', post_id)
     context = {
         'form': form,
@@ -102,16 +162,19 @@ def add_comment(request, post_id):
 
 @login_required
 def follow_index(request):
-    post_list = Post.objects.select_related('author', 'group').filter(
-        author__following__user=request.user
-    )
-    context = {'page_obj': paginator_posts(request, post_list)}
+    post_list, merged = follow_feed(request.user)
+    context = {'page_obj': paginator_posts(
+        request,
+        feed_queryset(post_list),
+        feed_count_key('follower', request.user.pk),
+        FEED_ESTIMATE_TIMEOUT if merged else None,
+    )}
     return render(request, 'posts/follow.html', context)
 
 
 @login_required
 def profile_follow(request, username):
-    author = get_object_or_404(User, username=username)
+    author = get_author_or_404(username)
     if request.user != author:
         Follow.objects.get_or_create(
             user=request.user,
@@ -122,6 +185,7 @@ def profile_follow(request, username):
 
 @login_required
 def profile_unfollow(request, username):
-    Follow.objects.filter(
-        user=request.user, author__username=username).delete()
+    author = find_author(username)
+    if author is not None:
+        Follow.objects.filter(user=request.user, author=author).delete()
     return redirect('posts:profile', username)
@@ -40,14 +40,19 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    'core.middleware.CookielessMiddleware',
+    'core.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
-    'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
-    'django.contrib.messages.middleware.MessageMiddleware',
+    'core.middleware.CsrfViewMiddleware',
+    'core.middleware.AuthenticationMiddleware',
+    'core.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Анонимные GET без сессионной куки к view с @cookieless идут мимо
+# сессий, CSRF, аутентификации и сообщений (core.middleware)
+COOKIELESS_FAST_PATH = True
+
 ROOT_URLCONF = 'yatube.urls'
 
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
@@ -123,6 +128,31 @@ STATIC_URL = '/static/'
 
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 
+# collectstatic кладёт сюда файлы с хэшем в имени и их копии .gz/.br
+STATIC_ROOT = os.path.join(BASE_DIR, 'collected_static')
+STATICFILES_STORAGE = 'core.storage.CompressedManifestStaticFilesStorage'
+
+# Раздача MEDIA_URL и STATIC_URL самим Django через core.files: сжатые
+# копии, 304, Range и долгий кэш для имён с хэшем. За nginx или Apache
+# FILES_OFFLOAD = 'x-accel-redirect' или 'x-sendfile' отдаёт тело им,
+# для nginx нужен internal location FILES_ACCEL_PREFIX с media/ и static/.
+SERVE_FILES = True
+FILES_OFFLOAD = None
+FILES_ACCEL_PREFIX = '/protected/'
+FILES_MAX_AGE = 60 * 60
+
+# Сессия и пользователь сессии читаются из кэша, запись идёт и в базу:
+# авторизованный запрос не ходит в базу до кода view, см. core.auth.
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+# ModelBackend остаётся вторым: сессии, открытые до CachedModelBackend,
+# хранят его путь и без него разлогинились бы. Новые входы идут через
+# первый бэкенд.
+AUTHENTICATION_BACKENDS = [
+    'core.auth.CachedModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
 LOGIN_URL = 'users:login'
 
 LOGIN_REDIRECT_URL = 'posts:index'
@@ -138,8 +168,51 @@ CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Загрузки пишутся сразу на диск; слишком большие файлы и картинки
+# отбрасываются по заголовку, до декодирования, см. core.uploads.
+FILE_UPLOAD_HANDLERS = ['core.uploads.BoundedUploadHandler']
+UPLOAD_MAX_FILE_SIZE = 10 * 1024 * 1024
+UPLOAD_MAX_IMAGE_PIXELS = 40 * 1000 * 1000
+
+# Картинки постов хранятся не больше этого по длинной стороне
+POSTS_IMAGE_MAX_SIDE = 2048
+# Повторно взятый файл картинки не удаляется столько секунд: дольше
+# любой транзакции, которая сохраняет пост с ним.
+POSTS_IMAGE_RELEASE_GRACE = 60 * 5
+
+# Общий файловый кэш для всех воркеров машины и LRU в памяти процесса
+# для ключей с вшитой версией (страницы и карточки), см. core.cache.
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache.TieredCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache'),
+        'OPTIONS': {
+            'SHARED_OPTIONS': {'MAX_ENTRIES': 10000, 'CULL_INTERVAL': 60},
+            'LOCAL_MAX_ENTRIES': 1000,
+            'LOCAL_TIMEOUT': 60,
+            'LOCAL_KEY_PREFIXES': (
+                'shared-page:', 'post-card:', 'template.cache.'),
+        },
     }
 }
+
+# Истёкшую запись кэша пересчитывает один запрос, остальные столько секунд
+# получают прежнюю копию или ждут пересчёта не дольше SINGLEFLIGHT_LOCK_TIMEOUT
+SINGLEFLIGHT_STALE_TIMEOUT = 60
+SINGLEFLIGHT_LOCK_TIMEOUT = 10
+
+# Паджинация лент по курсору (?after= / ?before=) вместо номеров страниц
+POSTS_CURSOR_PAGINATION = False
+
+# Сколько последних постов хранится в ленте подписок каждого пользователя;
+# лишнее удаляет периодическая команда trim_timelines
+POSTS_TIMELINE_LENGTH = 1000
+
+# Авторы с большим числом подписчиков подмешиваются в ленту при чтении;
+# обратно к раскладке их возвращает периодическая команда resume_fanout,
+# когда подписчиков не больше POSTS_FANOUT_RESUME_THRESHOLD
+POSTS_FANOUT_THRESHOLD = 1000
+POSTS_FANOUT_RESUME_THRESHOLD = 800
+
+# Сколько последних постов такого автора держится в кэше
+POSTS_PULL_RECENT_LENGTH = 200